@@ -1,15 +1,30 @@
+import os
 import sys
 import binascii
+import hashlib
+import mmap
+import multiprocessing
+import pickle
+import re
+import tempfile
+import unicodedata
+from array import array
 from base64 import b64decode
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from heapq import merge
+from itertools import compress, count, groupby, repeat
+from operator import itemgetter, ne
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QTreeWidget, QTreeWidgetItem, QLineEdit, QPushButton, QLabel,
     QFileDialog, QMessageBox, QMenu, QMenuBar, QStatusBar, QScrollArea,
     QHeaderView, QTabWidget, QSplitter, QTextEdit, QComboBox, QCheckBox,
-    QGroupBox
+    QGroupBox, QListWidget, QListWidgetItem, QProgressBar
 )
 from PyQt6.QtGui import QAction, QPixmap, QImage, QGuiApplication, QBrush, QColor, QFont
-from PyQt6.QtCore import Qt, QSize
+from PyQt6.QtCore import Qt, QSize, QThread, pyqtSignal
 from PIL import Image
 import io
 
@@ -22,263 +37,1692 @@ try:
 except ImportError:
     EXCEL_AVAILABLE = False
 
+# Files smaller than this are parsed in-process; larger ones are split
+# across a process pool by VcfParser.parse_vcf_file
+PARALLEL_PARSE_THRESHOLD = 16 * 1024 * 1024
+
+# Parsed files are cached here between runs, see VcfParseCache
+PARSE_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'vcf_viewer')
+PARSE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# Memory for sort keys before ExternalVcfComparator spills them to disk
+EXTERNAL_COMPARE_MEMORY = 256 * 1024 * 1024
+# "Similar Name" comparisons whose matches VcfComparator keeps, so comparing
+# edited files again only scores the names that changed
+SIMILAR_NAME_STATES = 2
+# What bytes.strip() strips, for text that has to be stripped the same way
+ASCII_WHITESPACE = ' \t\n\r\x0b\x0c'
+
+# Phone numbers written nationally (0912..., 912...) belong to this country
+DEFAULT_COUNTRY_CODE = '98'
+# Numbers with fewer digits are service or short codes, not national numbers
+MIN_NATIONAL_DIGITS = 7
+# Digits of the national number compared when matching by suffix
+PHONE_SUFFIX_DIGITS = 9
+# Distinct raw numbers remembered by canonical_phone
+PHONE_CACHE_SIZE = 64 * 1024
+# Least edit_similarity of two names that match with "Similar Name": one
+# typo is tolerated in names of four or more letters
+SIMILAR_NAME_THRESHOLD = 0.75
+
+# Deletes every ASCII character but digits and +
+_PHONE_ASCII_TABLE = {code: None for code in range(128) if not chr(code).isdigit() and chr(code) != '+'}
+
+@lru_cache(maxsize=PHONE_CACHE_SIZE)
+def canonical_phone(phone, country_code=DEFAULT_COUNTRY_CODE):
+    """E.164 form (+989121234567) of a phone number, or '' if it has no digits.
+
+    Digits of every script (Persian, Arabic-Indic, ...) count as digits.
+    A leading + or 00 marks an international number. A leading 0 is the
+    national trunk prefix, and is replaced by country_code. Without either,
+    a number of 11 or more digits that starts with country_code already
+    has it, and shorter ones get it. Numbers of fewer than
+    MIN_NATIONAL_DIGITS digits are service codes and are returned as bare
+    digits. Raw numbers repeat a lot across backups, hence the cache.
+    """
+    if phone.isascii():
+        digits = phone.translate(_PHONE_ASCII_TABLE)
+        international = digits.startswith('+')
+        digits = digits.replace('+', '')
+    else:
+        international = False
+        digits = []
+        for char in phone:
+            if char.isdecimal():
+                digits.append(str(unicodedata.decimal(char)))
+            elif char == '+' and not digits:
+                international = True
+        digits = ''.join(digits)
+
+    if not digits:
+        return ''
+    if international:
+        return '+' + digits
+    if digits.startswith('00'):
+        return '+' + digits[2:]
+    if len(digits) < MIN_NATIONAL_DIGITS:
+        return digits
+    if digits.startswith('0'):
+        return '+' + country_code + digits[1:]
+    if len(digits) >= 11 and digits.startswith(country_code):
+        return '+' + digits
+    return '+' + country_code + digits
+
+def normalize_phone(phone, country_code=DEFAULT_COUNTRY_CODE, suffix_digits=None):
+    """Normalize phone number for comparison.
+
+    The key is canonical_phone, or its last suffix_digits digits if given,
+    so that numbers match on their national number whatever country code
+    they were written with.
+    """
+    if not phone:
+        return ""
+    normalized = canonical_phone(phone, country_code)
+    if suffix_digits:
+        return normalized.lstrip('+')[-suffix_digits:]
+    return normalized
+
+# Folds what Persian and Arabic keyboards and encoders write differently
+# but readers do not tell apart: Arabic forms of Persian letters, hamza and
+# madda seats, zero-width and direction marks, tatweel, diacritics and
+# Persian/Arabic-Indic digits
+_NAME_TABLE = str.maketrans({
+    'ي': 'ی', 'ى': 'ی', 'ئ': 'ی', 'ك': 'ک', 'ۀ': 'ه', 'ة': 'ه', 'ؤ': 'و',
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    '\u200b': None, '\u200c': None, '\u200d': None, '\u200e': None,
+    '\u200f': None, '\ufeff': None, '\u0640': None, '\u0670': None,
+    **{chr(code): None for code in range(0x064B, 0x0656)},
+    **{chr(0x06F0 + digit): str(digit) for digit in range(10)},
+    **{chr(0x0660 + digit): str(digit) for digit in range(10)}
+})
+# Finds the characters _NAME_TABLE changes. Few names have any, and
+# translating a non-ASCII string costs several times this search
+_NAME_FOLD_RE = re.compile('[' + ''.join(map(chr, _NAME_TABLE)) + ']')
+# Finds a character other than those NFKC, lower() and _NAME_TABLE all
+# leave alone among ASCII and the Arabic block. Most Persian names have
+# none, and one search is cheaper than those three passes.
+_NAME_UNPLAIN_RE = re.compile('[^' + ''.join(
+    re.escape(char) for char in map(chr, [*range(0x20, 0x7F), *range(0x0600, 0x0700)])
+    if ord(char) not in _NAME_TABLE and char.lower() == char and not unicodedata.combining(char)
+    and unicodedata.normalize('NFKC', char) == char
+) + ']')
+
+def normalize_name(name):
+    """Normalize name for comparison, search and sorting.
+
+    The key is the NFKC form, lowercased, folded by _NAME_TABLE, with runs
+    of spaces collapsed. Every name key of a ContactStore, search term and
+    fuzzy key goes through here, once per name.
+    """
+    if not name:
+        return ""
+    if name.isascii():
+        name = name.lower()
+    elif _NAME_UNPLAIN_RE.search(name):
+        name = unicodedata.normalize('NFKC', name).lower()
+        if _NAME_FOLD_RE.search(name):
+            name = name.translate(_NAME_TABLE)
+    name = name.strip()
+    if '  ' in name:
+        name = ' '.join(name.split())
+    return name
+
+def fuzzy_name_key(name_key):
+    """A normalize_name key without its spaces, for "Similar Name" """
+    return name_key.replace(' ', '')
+
+def one_deletion_variants(key):
+    """key and every string made by deleting one character of it.
+
+    Two keys within one insertion, deletion, substitution or transposition
+    of each other always share a variant.
+    """
+    variants = {key[:i] + key[i + 1:] for i in range(len(key))}
+    variants.add(key)
+    return variants
+
+def edit_similarity(key1, key2):
+    """1 - edits / length of the longer of two fuzzy_name_keys, from 0 to 1.
+
+    An edit is one insertion, deletion, substitution or transposition of
+    adjacent characters. Keys more than one edit apart score 0, as do
+    empty keys.
+
+    >>> round(edit_similarity('johnsmith', 'jonhsmith'), 2)
+    0.89
+    >>> round(edit_similarity('johnsmith', 'jonsmith'), 2)
+    0.89
+    >>> round(edit_similarity('alexander', 'alexandre'), 2)
+    0.89
+    >>> edit_similarity('sara', 'sarah')
+    0.8
+    >>> edit_similarity('abc', 'bcd')
+    0.0
+    """
+    if key1 == key2:
+        return 1.0 if key1 else 0.0
+    if len(key1) < len(key2):
+        key1, key2 = key2, key1
+    if len(key1) - len(key2) > 1:
+        return 0.0
+    # Within one edit, everything past the first difference lines up again
+    start = next(compress(count(), map(ne, key1, key2)), len(key2))
+    if len(key1) > len(key2):
+        one_edit = key1[start + 1:] == key2[start:]
+    else:
+        one_edit = key1[start + 1:] == key2[start + 1:] or (
+            key1[start + 2:] == key2[start + 2:] and key1[start:start + 2] == key2[start:start + 2][::-1])
+    return 1 - 1 / len(key1) if one_edit else 0.0
+
+# Whitespace at the end of a line, which VcfParser strips
+_TRAILING_SPACE_RE = re.compile(rb'[ \t]+\n')
+
+def card_hash(card):
+    """Signed 64-bit hash of a card's normalized lines.
+
+    Line breaks, trailing whitespace and blank lines around the card do not
+    count, so a card hashes the same whether it comes from VcfParser or
+    VcfCardIndex, and whatever line endings its file was written with.
+    """
+    card = card.strip()
+    if b'\r' in card:
+        card = card.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+    if b' \n' in card or b'\t\n' in card:
+        card = _TRAILING_SPACE_RE.sub(b'\n', card)
+    return int.from_bytes(hashlib.blake2b(card, digest_size=8).digest(), 'little', signed=True)
+
 class Contact:
+    # Backups run to a million contacts, so no per-instance __dict__
+    __slots__ = ('name', 'phone', 'additional_phones', 'card', 'card_no', 'has_photo', 'selected', 'card_hash')
+
     def __init__(self, data):
         self.name = data['name']
         self.phone = data['phone']
         self.additional_phones = data['additional_phones']
-        self.original_lines = data['original_lines']
+        # The bytes of the card without its PHOTO as one object, or None if
+        # the parser did not keep it. Lines are only split out on request;
+        # the whole card and its photo are read back by card_no, see
+        # VcfCardIndex.card_lines and VcfCardIndex.photo_data.
+        self.card = data['card']
+        # Position of the card among all cards of its source, see VcfCardIndex
+        self.card_no = data['card_no']
         self.has_photo = data['has_photo']
-        self.photo_data = data['photo_data']
         self.selected = False
+        # card_hash of the source card, if the parser was asked for 'hash'
+        self.card_hash = None
+
+    @property
+    def original_lines(self):
+        if self.card is None:
+            return None
+        return VcfParser.card_lines(self.card)
+
+class ContactStore:
+    """Contacts kept as parallel columns instead of one Contact object each.
+
+    Row r is names[r], phones[r] (the first TEL, or None), the other TELs
+    extra_phones[phone_offsets[r]:phone_offsets[r + 1]], flags[r], and the
+    card_nos[r] and cards[r] of its source card, and card_hashes[r] if its
+    contacts were parsed with the 'hash' field. Filtering, sorting and
+    counting run over the columns; contact(r) builds a Contact only for the
+    rows that are shown or exported.
+
+    The normalized keys that matching, search and sorting compare are
+    columns too. Each is built on first use and kept, and VcfParseCache
+    stores the matching keys along with the contacts.
+    """
+    HAS_PHOTO = 1
+    SELECTED = 2
+    DELETED = 4
+
+    def __init__(self, contacts=()):
+        self.names = []
+        self.phones = []
+        self.extra_phones = []
+        self.phone_offsets = array('q', [0])
+        self.flags = bytearray()
+        self.card_nos = array('q')
+        self.cards = []
+        self.card_hashes = array('q')
+        # (country_code, suffix_digits) the phone key columns are built with
+        self.phone_key_options = (DEFAULT_COUNTRY_CODE, None)
+        self._clear_keys()
+        for contact in contacts:
+            self.append(contact)
+
+    def __len__(self):
+        return len(self.names)
+
+    def append(self, contact):
+        self.names.append(contact.name)
+        self.phones.append(contact.phone)
+        if contact.additional_phones:
+            self.extra_phones.extend(contact.additional_phones.split(', '))
+        self.phone_offsets.append(len(self.extra_phones))
+        flags = self.HAS_PHOTO if contact.has_photo else 0
+        if contact.selected:
+            flags |= self.SELECTED
+        self.flags.append(flags)
+        self.card_nos.append(contact.card_no)
+        self.cards.append(contact.card)
+        if contact.card_hash is not None:
+            self.card_hashes.append(contact.card_hash)
+        if (self._name_keys is not None or self._phone_keys is not None or
+                self._all_phone_keys is not None or self._search_texts is not None):
+            self._clear_keys()
+
+    def __getstate__(self):
+        # Search texts are quick to rebuild and not worth their cache space
+        state = self.__dict__.copy()
+        state['_search_texts'] = None
+        return state
+
+    def _clear_keys(self):
+        self._name_keys = None
+        self._phone_keys = None
+        self._all_phone_keys = None
+        self._search_texts = None
+
+    def set_phone_key_options(self, country_code, suffix_digits=None):
+        """Build phone keys with other normalize_phone options from now on"""
+        if (country_code, suffix_digits) != self.phone_key_options:
+            self.phone_key_options = (country_code, suffix_digits)
+            self._phone_keys = None
+            self._all_phone_keys = None
+
+    def build_keys(self):
+        """Build the matching key columns now rather than on first use"""
+        return self.name_keys, self.phone_keys
+
+    @property
+    def name_keys(self):
+        """normalize_name of every name, also the search and sort key"""
+        if self._name_keys is None:
+            self._name_keys = [normalize_name(name) for name in self.names]
+        return self._name_keys
+
+    @property
+    def phone_keys(self):
+        """normalize_phone of every first TEL"""
+        if self._phone_keys is None:
+            self._phone_keys = [normalize_phone(phone, *self.phone_key_options) for phone in self.phones]
+        return self._phone_keys
+
+    @property
+    def all_phone_keys(self):
+        """The distinct non-empty normalize_phone of all TELs of every row"""
+        if self._all_phone_keys is None:
+            phone_keys = self.phone_keys
+            extra_keys = [normalize_phone(phone, *self.phone_key_options) for phone in self.extra_phones]
+            offsets = self.phone_offsets
+            all_phone_keys = []
+            for row in range(len(self.names)):
+                start = offsets[row]
+                end = offsets[row + 1]
+                if start == end:
+                    all_phone_keys.append((phone_keys[row],) if phone_keys[row] else ())
+                else:
+                    keys = dict.fromkeys([phone_keys[row]] + extra_keys[start:end])
+                    keys.pop('', None)
+                    all_phone_keys.append(tuple(keys))
+            self._all_phone_keys = all_phone_keys
+        return self._all_phone_keys
+
+    @property
+    def search_texts(self):
+        """Name key and phones of every row, one per line, for search.
+
+        Phones go through normalize_name like search terms, so Persian and
+        Arabic-Indic digits find their ASCII forms and the other way round.
+        """
+        if self._search_texts is None:
+            name_keys = self.name_keys
+            phones = self.phones
+            self._search_texts = [
+                f"{name_keys[row]}\n{normalize_name(phones[row])}\n{normalize_name(self.additional_phones(row))}"
+                for row in range(len(self.names))
+            ]
+        return self._search_texts
+
+    def contact(self, row):
+        """A Contact with the values of one row"""
+        contact = Contact({
+            'name': self.names[row],
+            'phone': self.phones[row],
+            'additional_phones': self.additional_phones(row),
+            'card': self.cards[row],
+            'card_no': self.card_nos[row],
+            'has_photo': bool(self.flags[row] & self.HAS_PHOTO)
+        })
+        contact.selected = bool(self.flags[row] & self.SELECTED)
+        if self.has_card_hashes():
+            contact.card_hash = self.card_hashes[row]
+        return contact
+
+    def has_card_hashes(self):
+        """Whether every row has its card_hash"""
+        return len(self.card_hashes) == len(self.names)
+
+    def updated(self, card_index, parser, progress=None):
+        """A ContactStore of an edited version of this store's file.
+
+        This store must have card hashes. Cards of card_index with the hash
+        of one of its rows take that row, and only the others are parsed,
+        with parser. Returns None if most cards are new, since parsing the
+        whole file is faster then. progress, if given, is called as
+        progress(done, total) every 4096 cards hashed and again every 4096
+        cards taken or parsed; it may raise to stop the update.
+        """
+        card_hashes = self.card_hashes
+        first_rows = dict(zip(reversed(card_hashes), range(len(card_hashes) - 1, -1, -1)))
+        card_count = len(card_index)
+        sources = []
+        for card_no in range(card_count):
+            if progress and not card_no % 4096:
+                progress(card_no, 2 * card_count)
+            sources.append(first_rows.get(card_index.card_hash(card_no)))
+        if sources.count(None) * 2 > len(sources):
+            return None
+        
+        store = ContactStore()
+        store.phone_key_options = self.phone_key_options
+        # The row of this store every row was taken from, or None if parsed
+        reused = []
+        offsets = self.phone_offsets
+        for card_no, row in enumerate(sources):
+            if progress and not card_no % 4096:
+                progress(card_count + card_no, 2 * card_count)
+            if row is None:
+                contact = card_index.contact(card_no, parser)
+                if contact:
+                    store.append(contact)
+                    reused.append(None)
+                continue
+            store.names.append(self.names[row])
+            store.phones.append(self.phones[row])
+            if offsets[row] != offsets[row + 1]:
+                store.extra_phones.extend(self.extra_phones[offsets[row]:offsets[row + 1]])
+            store.phone_offsets.append(len(store.extra_phones))
+            store.flags.append(self.flags[row])
+            store.card_nos.append(card_no)
+            store.cards.append(self.cards[row])
+            store.card_hashes.append(card_hashes[row])
+            reused.append(row)
+        
+        if self._name_keys is not None:
+            store._name_keys = [
+                self._name_keys[row] if row is not None else normalize_name(name)
+                for row, name in zip(reused, store.names)
+            ]
+        if self._phone_keys is not None:
+            store._phone_keys = [
+                self._phone_keys[row] if row is not None else normalize_phone(phone, *store.phone_key_options)
+                for row, phone in zip(reused, store.phones)
+            ]
+        return store
+
+    def contacts(self, rows=None):
+        """Contacts for the given rows, or for every row that is not deleted"""
+        if rows is None:
+            rows = self.rows()
+        return [self.contact(row) for row in rows]
+
+    def additional_phones(self, row):
+        """The TELs after the first one, joined as in Contact.additional_phones"""
+        return ', '.join(self.extra_phones[self.phone_offsets[row]:self.phone_offsets[row + 1]])
+
+    def additional_phone_count(self, row):
+        return self.phone_offsets[row + 1] - self.phone_offsets[row]
+
+    def rows(self, flag=0):
+        """Rows that are not deleted and, if flag is given, have it set"""
+        skip = self.DELETED
+        if flag:
+            return [row for row, flags in enumerate(self.flags) if flags & (skip | flag) == flag]
+        return [row for row, flags in enumerate(self.flags) if not flags & skip]
+
+    def has_flag(self, row, flag):
+        return bool(self.flags[row] & flag)
+
+    def set_flag(self, rows, flag, value=True):
+        flags = self.flags
+        if value:
+            for row in rows:
+                flags[row] |= flag
+        else:
+            for row in rows:
+                flags[row] &= ~flag
+
+    def toggle_flag(self, rows, flag):
+        flags = self.flags
+        for row in rows:
+            flags[row] ^= flag
+
+    def count_flag(self, rows, flag):
+        flags = self.flags
+        return sum(1 for row in rows if flags[row] & flag)
+
+    def rows_with_phone(self, rows, with_phone=True):
+        """The rows whose first TEL is (or, if with_phone is False, is not) set"""
+        phones = self.phones
+        return [row for row in rows if bool(phones[row] and phones[row].strip()) == with_phone]
+
+    def search(self, rows, term):
+        """Rows whose name key or any of whose phones contain term.
+
+        term is one line of text; it cannot match across the line breaks
+        that separate the parts of a search text.
+        """
+        search_texts = self.search_texts
+        return [row for row in rows if term in search_texts[row]]
+
+    def duplicate_groups(self, rows, by_name=True, by_phone=True):
+        """Groups of rows that share a name key or any phone key, directly or through each other.
+
+        Each key kind has one hash index from key to the first row holding
+        it, and rows found under a key are joined to that row with a
+        union-find, so the cost is near-linear in the number of rows.
+        Groups of two or more rows are returned, each in the order of rows.
+        """
+        parent = {row: row for row in rows}
+
+        def find(row):
+            # Path halving keeps the trees flat
+            while parent[row] != row:
+                parent[row] = parent[parent[row]]
+                row = parent[row]
+            return row
+
+        def union(row, other):
+            root = find(row)
+            other_root = find(other)
+            if root != other_root:
+                parent[other_root] = root
+
+        if by_name:
+            name_keys = self.name_keys
+            first_rows = {}
+            for row in rows:
+                first = first_rows.setdefault(name_keys[row], row)
+                if first != row:
+                    union(first, row)
+        if by_phone:
+            all_phone_keys = self.all_phone_keys
+            first_rows = {}
+            for row in rows:
+                for key in all_phone_keys[row]:
+                    first = first_rows.setdefault(key, row)
+                    if first != row:
+                        union(first, row)
+
+        groups = {}
+        for row in rows:
+            groups.setdefault(find(row), []).append(row)
+        return [group for group in groups.values() if len(group) > 1]
 
 class VcfParser:
+    # Everything a Contact can be built from, see __init__
+    FIELDS = frozenset({'name', 'tel', 'photo', 'lines', 'hash'})
+    # What is extracted when no fields are given. Hashing costs about a tenth
+    # of the parse time and is only needed to re-compare edited files.
+    DEFAULT_FIELDS = FIELDS - {'hash'}
+    # A BEGIN:VCARD or END:VCARD line, possibly indented. Patterns here start
+    # with a line break rather than ^, which lets re skip ahead to the next
+    # candidate line much faster.
+    CARD_BOUNDARY_RE = re.compile(rb'\n[^\S\n]*(BEGIN|END):VCARD')
+    # A line indented with whitespace other than a space or tab, which is
+    # stripped rather than read as a folded line
+    UNUSUAL_INDENT_RE = re.compile(rb'\n[\x0b\x0c]')
+    # First byte of a line that continues the property before it. The in
+    # operator is slow on bytes, so hot loops test line[:1] against this set.
+    CONTINUATION_STARTS = frozenset((b'', b' ', b'\t', b'='))
+    # Byte ranges of a file per parse_vcf_file worker. More ranges than
+    # workers let a stopped parse end sooner and even out uneven ranges.
+    RANGES_PER_WORKER = 4
+
+    def __init__(self, fields=None, fast_path=True):
+        """fields limits what is extracted from each card.
+
+        'name' is always extracted, since a card without a name is not a
+        contact. Without 'tel' or 'photo' those properties are skipped by the
+        tokenizer. With 'lines' the card's bytes, less any PHOTO, are kept
+        in Contact.card for original_lines. The whole card and its photo,
+        most of a card that has one, are read back by card number with
+        VcfCardIndex.card_lines and VcfCardIndex.photo_data. With 'hash',
+        every contact gets the card_hash of its card.
+
+        Simple cards are read with a regex instead of the tokenizer unless
+        fast_path is False. Results are the same either way.
+        """
+        if fields is None:
+            fields = self.DEFAULT_FIELDS
+        unknown = set(fields) - self.FIELDS
+        if unknown:
+            raise ValueError(f"Unknown contact fields: {', '.join(sorted(unknown))}")
+        self.fields = frozenset(fields) | {'name'}
+
+        token_names = [b'N', b'FN']
+        if 'tel' in self.fields:
+            token_names.append(b'TEL')
+        if 'photo' in self.fields:
+            token_names.append(b'PHOTO')
+        self._token_names = tuple(token_names)
+        # (name, ;params, value, continuation) of each wanted property in the
+        # decoded text of a card. value takes in the lines starting with '='
+        # that continue quoted-printable text; continuation is set if a line
+        # after that still folds into it.
+        self._property_re = re.compile(r'\n((?:%s)[^;:\n]*)([^:\n]*):(.*(?:\n=.*)*)(\n(?:[^\S\n]*\n)*[ \t=])?'
+                                       % '|'.join(name.decode() for name in token_names), re.I | re.A)
+        self.fast_path = fast_path
+
+    def iter_vcf(self, fileobj, chunk_size=64 * 1024, progress=None):
+        """Yield contacts from a file object as soon as each END:VCARD is read.
+
+        The file is consumed in chunks, so memory is bounded by the largest
+        single card rather than by the size of the file. Each chunk is cut at
+        its last BEGIN:VCARD line and the cards before it are parsed together.
+
+        Binary file objects are read as they are. Only the values a Contact
+        keeps are decoded, see _property_text. Text file objects are encoded
+        back to UTF-8 first.
+
+        progress, if given, is called with the length read so far after
+        every chunk; it may raise to stop the parse.
+        """
+        pending = b''
+        carry = b''
+        card_no = 0
+        read = 0
+        while True:
+            chunk = fileobj.read(chunk_size)
+            if not chunk:
+                break
+            if progress:
+                read += len(chunk)
+                progress(read)
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8', 'surrogateescape')
+            chunk = carry + chunk
+            carry = b''
+            if chunk.endswith(b'\r'):
+                # Possibly the first half of a \r\n split between two reads
+                chunk, carry = chunk[:-1], b'\r'
+            pending += self._universal_newlines(chunk)
+            cut = self._last_card_start(pending)
+            if cut > 0:
+                contacts, card_count = self._parse_span(pending[:cut], False, card_no)
+                yield from contacts
+                card_no += card_count
+                pending = pending[cut:]
+        pending += self._universal_newlines(carry)
+        if pending:
+            contacts, _ = self._parse_span(pending, True, card_no)
+            yield from contacts
+
     def parse_vcf(self, vcf_content):
-        lines = vcf_content.strip().split('\n')
-        vcard_entries = []
+        """Parse the contents of a .vcf file, given as bytes or as text
+
+        >>> card = "  BEGIN:VCARD\\n  N:I;J\\n  TEL:9\\n  END:VCARD\\n"
+        >>> [(c.name, c.phone) for c in VcfParser().parse_vcf(card)]
+        [('I J', '9')]
+        """
+        if isinstance(vcf_content, str):
+            vcf_content = vcf_content.encode('utf-8', 'surrogateescape')
+        return list(self.iter_vcf(io.BytesIO(vcf_content)))
+
+    def parse_vcf_file(self, file_path, workers=None, parallel_threshold=PARALLEL_PARSE_THRESHOLD, progress=None):
+        """Parse a .vcf file, spreading large files over a process pool.
+
+        The file is cut at BEGIN:VCARD lines into roughly equal byte ranges,
+        RANGES_PER_WORKER per worker. Contacts come back in file order and
+        are identical to what the serial parser produces. progress, if
+        given, is called as progress(done, size) with the bytes parsed so
+        far; it may raise to stop the parse.
+        """
+        workers = workers or os.cpu_count() or 1
+        size = os.path.getsize(file_path)
+        if workers == 1 or size == 0 or size < parallel_threshold:
+            with open(file_path, 'rb') as f:
+                return list(self.iter_vcf(f, progress=progress and (lambda done: progress(done, size))))
+
+        ranges = _split_vcf_ranges(file_path, workers * self.RANGES_PER_WORKER)
+        starts = [start for start, end in ranges]
+        ends = [end for start, end in ranges]
+        at_eof = [False] * (len(ranges) - 1) + [True]
+
+        contacts = []
+        first_card_no = 0
+        # Workers are spawned rather than forked: the file may be parsed on a
+        # thread of the GUI, and a child forked from a process with other
+        # threads can hang on a lock one of them held
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        try:
+            results = executor.map(_parse_vcf_range, repeat(self), repeat(file_path), starts, ends, at_eof)
+            for (chunk, card_count), end in zip(results, ends):
+                # Workers number cards from zero within their own range
+                for contact in chunk:
+                    contact.card_no += first_card_no
+                contacts.extend(chunk)
+                first_card_no += card_count
+                if progress:
+                    progress(end, size)
+        finally:
+            # A stopped parse does not wait for the ranges still being parsed
+            executor.shutdown(wait=False, cancel_futures=True)
+        return contacts
+
+    @staticmethod
+    def _last_card_start(data):
+        """Offset of the line holding the last BEGIN:VCARD in data, or 0"""
+        pos = len(data)
+        while True:
+            pos = data.rfind(b'BEGIN:VCARD', 0, pos)
+            if pos <= 0:
+                return 0
+            line_start = data.rfind(b'\n', 0, pos) + 1
+            if not data[line_start:pos].strip():
+                return line_start
+
+    @staticmethod
+    def _universal_newlines(data):
+        """data with \r\n and lone \r line breaks turned into \n"""
+        if b'\r' in data:
+            data = data.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+        return data
+
+    @staticmethod
+    def _iter_entries(lines, trim_tail=True):
+        """Group lines into cards, yielding the lines of each card.
+
+        Trailing whitespace is stripped. A line indented past its card's
+        BEGIN:VCARD line with a space or tab is a folded continuation line
+        and keeps that extra indent; other lines are stripped, so a card
+        indented as a whole reads like one that is not.
+        """
         current_entry = []
         in_vcard = False
+        indent = 0
 
         for line in lines:
-            line = line.strip()
-            if line.startswith('BEGIN:VCARD'):
-                if in_vcard:
-                    vcard_entries.append(current_entry)
-                current_entry = [line]
-                in_vcard = True
-            elif line.startswith('END:VCARD'):
-                current_entry.append(line)
-                vcard_entries.append(current_entry)
-                current_entry = []
-                in_vcard = False
+            head = line.strip()
+            if head.startswith((b'BEGIN:VCARD', b'END:VCARD')):
+                if head[:1] == b'B':
+                    if in_vcard:
+                        yield current_entry
+                    current_entry = [head]
+                    in_vcard = True
+                    indent = line.find(b'B')
+                elif in_vcard:
+                    current_entry.append(head)
+                    yield current_entry
+                    current_entry = []
+                    in_vcard = False
             elif in_vcard:
-                current_entry.append(line)
+                if head and line[indent:indent + 1] in (b' ', b'\t') and not line[:indent].strip():
+                    current_entry.append(line[indent:].rstrip())
+                else:
+                    current_entry.append(head)
 
         if in_vcard and current_entry:
-            vcard_entries.append(current_entry)
+            if trim_tail:
+                # Blank lines at the very end of the input never belong to a card
+                while current_entry[-1] == b'':
+                    current_entry.pop()
+            yield current_entry
+
+    def _iter_cards(self, data, at_eof=True):
+        """Yield the bytes of every card in data.
+
+        Cards are the same as those of _iter_entries, but found with one regex
+        search over the whole span and returned unsplit. A card runs from its
+        BEGIN:VCARD line up to the end of its END:VCARD line, or up to the
+        next BEGIN:VCARD line if it is not terminated.
+        """
+        start = None
+        # With a line break put in front, match.start() is the offset of the
+        # matched line in data itself
+        for match in self.CARD_BOUNDARY_RE.finditer(b'\n' + data):
+            if match.group(1) == b'BEGIN':
+                if start is not None:
+                    yield data[start:match.start() - 1]
+                start = match.start()
+            elif start is not None:
+                end = data.find(b'\n', match.end() - 1)
+                yield data[start:end if end >= 0 else len(data)]
+                start = None
 
+        if start is not None:
+            # The span's own final line break is not an empty line
+            card = data[start:-1] if data.endswith(b'\n') else data[start:]
+            if at_eof:
+                # Blank lines at the very end of the input never belong to a card
+                card = card.rstrip()
+            yield card
+
+    def _span_entries(self, data, at_eof=True):
+        """Card lines in a byte span that was cut from a file at card boundaries"""
+        lines = self._universal_newlines(data).split(b'\n')
+        if lines[-1] == b'':
+            # The span's own final line break, not an empty line
+            lines.pop()
+        return self._iter_entries(lines, trim_tail=at_eof)
+
+    def _parse_span(self, data, at_eof=True, first_card_no=0):
+        """Parse a byte span, returning its contacts and its number of cards"""
         contacts = []
-        for entry in vcard_entries:
-            processed_lines = []
-            current_line = None
-
-            for line in entry:
-                if line.startswith('='):
-                    if current_line is not None:
-                        current_line += line[1:]
-                else:
-                    if current_line is not None:
-                        processed_lines.append(current_line)
-                    current_line = line
-
-            if current_line is not None:
-                processed_lines.append(current_line)
-
-            name = None
-            fn_name = None  # Full Name from FN field
-            phones = []
-            photo_data = None
-            original_lines = entry.copy()
-            has_photo = False
-
-            for idx, line in enumerate(processed_lines):
-                if line.startswith('END:VCARD'):
-                    break
-                if ':' not in line:
+        card_count = 0
+        data = self._universal_newlines(data)
+        # Unusual indentation is rare enough to rule out for all cards at once
+        unusual_indent = self.UNUSUAL_INDENT_RE.search(data) is not None
+        hash_cards = 'hash' in self.fields
+        for card_count, card in enumerate(self._iter_cards(data, at_eof), 1):
+            if self.fast_path:
+                contact = self._card_contact(card, first_card_no + card_count - 1, unusual_indent)
+            else:
+                contact = self._tokenized_contact(card, first_card_no + card_count - 1)
+            if contact:
+                if hash_cards:
+                    contact.card_hash = card_hash(card)
+                contacts.append(contact)
+        return contacts, card_count
+
+    def _card_contact(self, card, card_no, unusual_indent=True):
+        """Build a Contact straight from the bytes of one card.
+
+        A card that is valid UTF-8 is decoded in one go, and its N, FN, TEL
+        and PHOTO lines are picked out of the text with one regex, without
+        looking at the other lines. Other cards go through the tokenizer,
+        which decodes each value by its own CHARSET, and so do cards that
+        declare another charset, fold one of those properties over several
+        lines (other than with leading '='), or are indented as a whole or
+        unusually.
+        """
+        if card[:1] in (b' ', b'\t') or (unusual_indent and self.UNUSUAL_INDENT_RE.search(card)):
+            return self._tokenized_contact(card, card_no)
+        try:
+            text = card.decode('utf-8')
+        except UnicodeDecodeError:
+            return self._tokenized_contact(card, card_no)
+
+        name = None
+        fn_name = None
+        phones = []
+        has_photo = False
+        for token_name, params, value, continued in self._property_re.findall(text):
+            first = token_name[0].upper()
+            if first == 'P':
+                # The payload is read lazily, so its lines are never looked at
+                has_photo = True
+                continue
+
+            params = params.upper()
+            # Strip like bytes.rstrip() does in the tokenizer, not every
+            # Unicode space
+            parts = value.split('\n=')
+            value = parts[0].rstrip(ASCII_WHITESPACE) if len(parts) == 1 else ''.join([part.rstrip(ASCII_WHITESPACE) for part in parts])
+            if continued or ('CHARSET=' in params and 'CHARSET=UTF-8' not in params):
+                return self._tokenized_contact(card, card_no)
+            if 'QUOTED-PRINTABLE' in params:
+                if value.endswith('=') or not value.isascii():
+                    return self._tokenized_contact(card, card_no)
+                value = binascii.a2b_qp(value.replace('==', '=')).decode('utf-8', 'replace')
+                if first == 'N':
+                    name = value.replace(';', ' ')
                     continue
-                
-                # Split only on the first colon to handle values with colons
-                colon_index = line.find(':')
-                if colon_index == -1:
+
+            if first == 'N':
+                name = self._structured_name(value)
+            elif first == 'F':
+                fn_name = value
+            else:
+                phones.append(value)
+
+        return self._new_contact(name, fn_name, phones, has_photo, card if 'lines' in self.fields else None, card_no)
+
+    def _tokenized_contact(self, card, card_no):
+        """Build a Contact from the bytes of one card with the tokenizer"""
+        return self._build_contact(self.card_lines(card), card_no, card)
+
+    @staticmethod
+    def card_lines(card):
+        """The lines of a card's bytes, trailing whitespace stripped"""
+        return next(VcfParser._iter_entries(card.split(b'\n'), False))
+
+    @staticmethod
+    def photo_payload(card):
+        """Base64 bytes of the card's last BASE64 PHOTO property, or None"""
+        lines = VcfParser.card_lines(card)
+        parser = VcfParser()
+        photo_line = None
+        for key, params, value, line_no in parser.tokenize(lines, parser._token_names):
+            if key.startswith(b'PHOTO') and b'BASE64' in params:
+                photo_line = line_no
+        if photo_line is None:
+            return None
+
+        photo_lines = []
+        for line in lines[photo_line:]:
+            line = line.strip()
+            if not photo_lines:
+                photo_lines.append(line[line.find(b':') + 1:])
+            elif line.startswith(b'='):
+                photo_lines.append(line[1:])
+            elif b':' not in line:
+                photo_lines.append(line)
+            else:
+                break
+        return b''.join(photo_lines).replace(b' ', b'').replace(b'\n', b'')
+
+    @staticmethod
+    def strip_photo(card):
+        """A card's bytes without its PHOTO properties, payload lines read as photo_payload does"""
+        kept = []
+        in_photo = False
+        for line in card.split(b'\n'):
+            if in_photo:
+                stripped = line.strip()
+                if stripped.startswith(b'=') or b':' not in stripped:
                     continue
-                    
-                key = line[:colon_index]
-                value = line[colon_index + 1:]
-                key = key.upper()
-
-                # Handle N field (structured name)
-                if key.startswith('N'):
-                    if 'CHARSET=UTF-8' in key and 'ENCODING=QUOTED-PRINTABLE' in key:
-                        value = value.replace('==', '=')
-                        try:
-                            decoded_bytes = binascii.a2b_qp(value)
-                            name = decoded_bytes.decode('utf-8').replace(';', ' ')
-                        except Exception as e:
-                            name = f"Error decoding N: {e}"
-                    else:
-                        # Handle simple N field format (e.g., N:;gffk;;;)
-                        # N field format: Family;Given;Additional;Prefix;Suffix
-                        name_parts = value.split(';')
-                        name_components = []
-                        
-                        # Extract non-empty parts
-                        for i, part in enumerate(name_parts[:5]):  # Only take first 5 parts
-                            if part.strip():
-                                name_components.append(part.strip())
-                        
-                        if name_components:
-                            name = ' '.join(name_components)
-                        else:
-                            # If N field is empty or only semicolons, we'll use FN later
-                            name = None
-                
-                # Handle FN field (formatted/full name)
-                elif key.startswith('FN'):
-                    if 'CHARSET=UTF-8' in key and 'ENCODING=QUOTED-PRINTABLE' in key:
-                        value = value.replace('==', '=')
-                        try:
-                            decoded_bytes = binascii.a2b_qp(value)
-                            fn_name = decoded_bytes.decode('utf-8')
-                        except Exception as e:
-                            fn_name = f"Error decoding FN: {e}"
-                    else:
-                        fn_name = value.strip()
-                
-                # Handle telephone numbers
-                elif key.startswith('TEL'):
-                    phones.append(value)
-                
-                # Handle photos
-                elif key.startswith('PHOTO'):
-                    has_photo = True
-                    if 'BASE64' in key:
-                        photo_lines = [value]
-                        next_idx = idx + 1
-                        while next_idx < len(processed_lines):
-                            next_line = processed_lines[next_idx]
-                            if next_line.startswith(' ') or ':' not in next_line:
-                                photo_lines.append(next_line.strip())
-                                next_idx += 1
-                            else:
-                                break
-                        photo_data = ''.join(photo_lines).replace(' ', '').replace('\n', '')
-
-            # Determine the final name to use
-            final_name = None
+                in_photo = False
+            if line.lstrip()[:5].upper() == b'PHOTO':
+                in_photo = True
+                continue
+            kept.append(line)
+        return b'\n'.join(kept)
+
+    def tokenize(self, lines, names=None):
+        """Split the lines of one card into (name, params, value, line_no) tokens.
+
+        One pass unfolds continuation lines starting with a space or tab
+        (RFC 6350), joins quoted-printable soft line breaks, and splits every
+        property into its upper-cased name, upper-cased parameter string and
+        value. line_no is the index of the property's first line. Lines and
+        tokens are bytes; _property_text decodes a value.
+
+        If names is a tuple of prefixes, other properties are skipped without
+        joining their lines. PHOTO payloads are never joined here: the value
+        is only the text on the PHOTO line, and photo_payload reads the rest
+        when a photo is shown.
+        """
+        continuation_starts = self.CONTINUATION_STARTS
+        name = None
+        skipping = False
+
+        for line_no, line in enumerate(lines):
+            if skipping:
+                if line[:1] in continuation_starts:
+                    continue
+                skipping = False
+            elif name is not None:
+                if line[:1] in continuation_starts:
+                    # Folded line, or a quoted-printable line continued with '='
+                    parts.append(line[1:])
+                    continue
+                if quoted_printable and parts[-1].endswith(b'='):
+                    # Quoted-printable soft line break
+                    parts[-1] = parts[-1][:-1]
+                    parts.append(line)
+                    continue
+                yield name, params, parts[0] if len(parts) == 1 else b''.join(parts), start
+                name = None
+
+            key, colon, value = line.partition(b':')
+            if not colon:
+                # Not a property, e.g. a base64 line that was not indented
+                continue
+
+            key = key.upper()
+            if names is not None and not key.startswith(names):
+                if key == b'END' and value.startswith(b'VCARD'):
+                    return
+                skipping = True
+                continue
+
+            token_name, _, token_params = key.partition(b';')
+            if token_name.startswith(b'PHOTO'):
+                yield token_name, token_params, value, line_no
+                skipping = True
+            elif token_name == b'END' and line.startswith(b'END:VCARD'):
+                return
+            else:
+                name, params, start = token_name, token_params, line_no
+                parts = [value]
+                quoted_printable = b'QUOTED-PRINTABLE' in token_params
+
+        if name is not None:
+            yield name, params, parts[0] if len(parts) == 1 else b''.join(parts), start
+
+    def _build_contact(self, entry, card_no=0, card=None):
+        """Build a Contact from the lines of one card, or None if it has no name"""
+        name = None
+        fn_name = None  # Full Name from FN field
+        phones = []
+        has_photo = False
+
+        # Only N*, FN, TEL and PHOTO properties are tokenized, so the first
+        # letter of the name is enough to tell them apart
+        for key, params, value, line_no in self.tokenize(entry, self._token_names):
+            first = key[:1]
+
+            # Handle N field (structured name)
+            if first == b'N':
+                name = self._name_from_n(params, value)
+            
+            # Handle FN field (formatted/full name)
+            elif first == b'F':
+                fn_name = self._property_text(params, value)
             
-            # Priority: 1. Parsed N field, 2. FN field, 3. Skip if both empty
-            if name and name.strip():
-                final_name = name.strip()
-            elif fn_name and fn_name.strip():
-                final_name = fn_name.strip()
+            # Handle telephone numbers
+            elif first == b'T':
+                phones.append(self._property_text(params, value))
             
-            # Only create contact if we have a name
-            if final_name:
-                main_phone = phones[0] if phones else None
-                additional_phones = ', '.join(phones[1:]) if len(phones) > 1 else ''
-                contacts.append(Contact({
-                    'name': final_name.replace('ي', 'ی').replace('ك', 'ک'),
-                    'phone': main_phone,
-                    'additional_phones': additional_phones,
-                    'original_lines': original_lines,
-                    'has_photo': has_photo,
-                    'photo_data': photo_data
-                }))
+            # Handle photos, whose payload is only read from the card when
+            # the photo is shown, see VcfCardIndex.photo_data
+            else:
+                has_photo = True
 
-        return contacts
+        return self._new_contact(name, fn_name, phones, has_photo, card if 'lines' in self.fields else None, card_no)
 
-class ExcelExporter:
-    """Class to handle Excel export functionality"""
-    
     @staticmethod
-    def export_contacts_to_excel(contacts, file_path, sheet_name="Contacts", include_metadata=True):
-        """Export contacts to Excel file"""
-        if not EXCEL_AVAILABLE:
-            raise ImportError("openpyxl library is required for Excel export. Install it with: pip install openpyxl")
-        
-        wb = Workbook()
-        ws = wb.active
-        ws.title = sheet_name
-        
-        # Define headers
-        headers = ['#', 'Name', 'Phone', 'Additional Phones', 'Has Photo']
-        
-        # Style the headers
-        header_font = Font(bold=True, color="FFFFFF")
-        header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-        header_alignment = Alignment(horizontal="center", vertical="center")
-        
-        # Write headers
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col, value=header)
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = header_alignment
-        
-        # Write contact data
-        for row, contact in enumerate(contacts, 2):
-            ws.cell(row=row, column=1, value=row-1)  # Index
-            ws.cell(row=row, column=2, value=contact.name)
-            ws.cell(row=row, column=3, value=contact.phone or "No Phone")
-            ws.cell(row=row, column=4, value=contact.additional_phones or "-")
-            ws.cell(row=row, column=5, value="Yes" if contact.has_photo else "No")
-        
-        # Auto-adjust column widths
-        for col in range(1, len(headers) + 1):
-            column_letter = get_column_letter(col)
-            max_length = 0
-            for row in range(1, len(contacts) + 2):
-                cell_value = str(ws.cell(row=row, column=col).value or "")
-                if len(cell_value) > max_length:
-                    max_length = len(cell_value)
-            # Set column width with some padding
-            ws.column_dimensions[column_letter].width = min(max_length + 2, 50)
-        
-        # Add metadata if requested
-        if include_metadata:
-            metadata_row = len(contacts) + 3
-            ws.cell(row=metadata_row, column=1, value="Export Information:")
-            ws.cell(row=metadata_row, column=1).font = Font(bold=True)
-            
-            ws.cell(row=metadata_row + 1, column=1, value=f"Total Contacts: {len(contacts)}")
-            ws.cell(row=metadata_row + 2, column=1, value=f"Export Date: 2025-06-10 01:00:27 UTC")
-            ws.cell(row=metadata_row + 3, column=1, value="Exported by: VCF Viewer Tool")
-            ws.cell(row=metadata_row + 4, column=1, value="Created by: CodeMasters360")
-        
-        # Save the workbook
-        wb.save(file_path)
-    
+    def _property_text(params, value):
+        """Decode a property value by its ENCODING and CHARSET parameters.
+
+        Values are UTF-8 unless a CHARSET says otherwise. A value that does
+        not decode with its charset is decoded as UTF-8 with bad bytes
+        replaced, so one corrupt property never stops a file from loading.
+        """
+        charset = 'utf-8'
+        if params:
+            if b'QUOTED-PRINTABLE' in params:
+                value = binascii.a2b_qp(value.replace(b'==', b'='))
+            start = params.find(b'CHARSET=')
+            if start >= 0:
+                charset = params[start + 8:].partition(b';')[0].decode('ascii', 'replace')
+        try:
+            return value.decode(charset)
+        except (LookupError, UnicodeDecodeError):
+            return value.decode('utf-8', 'replace')
+
     @staticmethod
-    def export_comparison_to_excel(comparison_results, file_path, match_method, phone_filter):
-        """Export comparison results to Excel with multiple sheets"""
-        if not EXCEL_AVAILABLE:
-            raise ImportError("openpyxl library is required for Excel export. Install it with: pip install openpyxl")
-        
-        wb = Workbook()
-        
-        # Remove default sheet
-        wb.remove(wb.active)
-        
-        # Create summary sheet
-        summary_ws = wb.create_sheet("Summary")
-        ExcelExporter._create_summary_sheet(summary_ws, comparison_results, match_method, phone_filter)
-        
-        # Create sheets for each category
-        if comparison_results['only_in_file1']:
-            file1_ws = wb.create_sheet("Only in File 1")
-            ExcelExporter._create_contacts_sheet(file1_ws, comparison_results['only_in_file1'], "Only in File 1")
-        
-        if comparison_results['only_in_file2']:
-            file2_ws = wb.create_sheet("Only in File 2")
-            ExcelExporter._create_contacts_sheet(file2_ws, comparison_results['only_in_file2'], "Only in File 2")
+    def _name_from_n(params, value):
+        """Name from an N value, or None if it is empty"""
+        value = VcfParser._property_text(params, value)
+        if b'QUOTED-PRINTABLE' in params:
+            return value.replace(';', ' ')
+        return VcfParser._structured_name(value)
+
+    @staticmethod
+    def _structured_name(value):
+        """Name from the text of a plain N value, or None if it is empty"""
+        # Handle simple N field format (e.g., N:;gffk;;;)
+        # N field format: Family;Given;Additional;Prefix;Suffix
+        name_parts = value.split(';')
+        name_components = []
         
-        if comparison_results['common']:
-            common_ws = wb.create_sheet("Common Contacts")
-            ExcelExporter._create_common_contacts_sheet(common_ws, comparison_results['common'])
+        # Extract non-empty parts
+        for i, part in enumerate(name_parts[:5]):  # Only take first 5 parts
+            if part.strip():
+                name_components.append(part.strip())
         
-        wb.save(file_path)
-    
+        if name_components:
+            return ' '.join(name_components)
+        # If N field is empty or only semicolons, we'll use FN later
+        return None
+
     @staticmethod
-    def _create_summary_sheet(ws, results, match_method, phone_filter):
-        """Create summary sheet for comparison results"""
-        # Title
-        ws.cell(row=1, column=1, value="VCF File Comparison Summary")
-        ws.cell(row=1, column=1).font = Font(size=16, bold=True)
+    def _new_contact(name, fn_name, phones, has_photo, card, card_no):
+        """Contact from the extracted properties, or None if it has no name"""
+        # Determine the final name to use
+        final_name = None
         
-        # Comparison details
-        ws.cell(row=3, column=1, value="Comparison Details:")
-        ws.cell(row=3, column=1).font = Font(bold=True)
-        ws.cell(row=4, column=1, value=f"Match Method: {match_method}")
+        # Priority: 1. Parsed N field, 2. FN field, 3. Skip if both empty
+        if name and name.strip():
+            final_name = name.strip()
+        elif fn_name and fn_name.strip():
+            final_name = fn_name.strip()
+        
+        # Only create contact if we have a name, shown with the Persian
+        # forms of the letters Arabic keyboards write differently
+        if final_name:
+            if not final_name.isascii():
+                final_name = final_name.replace('ي', 'ی').replace('ك', 'ک')
+            main_phone = phones[0] if phones else None
+            additional_phones = ', '.join(phones[1:]) if len(phones) > 1 else ''
+            if has_photo and card is not None:
+                card = VcfParser.strip_photo(card)
+            return Contact({
+                'name': final_name,
+                'phone': main_phone,
+                'additional_phones': additional_phones,
+                'card': card,
+                'card_no': card_no,
+                'has_photo': has_photo
+            })
+        return None
+
+class VcfCardIndex:
+    """Byte offsets of every card in a .vcf file, found by scanning a memory map.
+
+    Card boundaries are located with bytes.find, so opening a large file only
+    costs one C-speed scan. Cards are parsed one at a time on request.
+    """
+    BEGIN_MARKER = b'BEGIN:VCARD'
+    END_MARKER = b'END:VCARD'
+
+    def __init__(self, file_path, scan=True):
+        """Without scan, no offsets are kept; iter_spans walks the file instead"""
+        self.file_path = file_path
+        self.starts = array('q')
+        self.ends = array('q')
+        self._byte_hits = {}
+        self._file = open(file_path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            self._map = b''
+        if scan:
+            self._scan()
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self):
+        """Iterate over the contacts of all cards that have a name"""
+        parser = VcfParser()
+        for i in range(len(self.starts)):
+            contact = self.contact(i, parser)
+            if contact:
+                yield contact
+
+    def card_bytes(self, i):
+        return self._map[self.starts[i]:self.ends[i]]
+
+    def span_bytes(self, start, end):
+        return self._map[start:end]
+
+    def card_hash(self, i):
+        return card_hash(self.card_bytes(i))
+
+    def size(self):
+        return len(self._map)
+
+    def card_lines(self, i):
+        """The lines of card i, as Contact.original_lines but with any PHOTO"""
+        return next(VcfParser()._span_entries(self.card_bytes(i), self._at_eof(i)))
+
+    def contact(self, i, parser=None):
+        """Decode and parse card i, or return None if it has no name"""
+        parser = parser or VcfParser()
+        contacts, _ = parser._parse_span(self.card_bytes(i), self._at_eof(i), first_card_no=i)
+        return contacts[0] if contacts else None
+
+    def contacts(self, first, last, parser=None):
+        """Parse cards first to last (exclusive) together, returning those with a name"""
+        parser = parser or VcfParser()
+        end = self.ends[last - 1]
+        contacts, card_count = parser._parse_span(self.span_bytes(self.starts[first], end), self._at_eof(last - 1), first)
+        if card_count != last - first:
+            # The parser split the span differently; go card by card
+            contacts = []
+            for i in range(first, last):
+                contact = self.contact(i, parser)
+                if contact:
+                    contacts.append(contact)
+        return contacts
+
+    def photo_data(self, i):
+        """Base64 payload of card i's photo, or None"""
+        return VcfParser.photo_payload(self.card_bytes(i))
+
+    def _at_eof(self, i):
+        return self.ends[i] == len(self._map)
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+    def _scan(self):
+        for start, end in self.iter_spans():
+            self.starts.append(start)
+            self.ends.append(end)
+
+    def iter_spans(self):
+        """Yield the (start, end) offsets of every card with the same rules as VcfParser.iter_vcf"""
+        self._byte_hits = {}
+        buf = self._map
+        size = len(buf)
+        card_start = -1
+        next_begin = self._find_marker(self.BEGIN_MARKER, 0)
+
+        while True:
+            if card_start == -1:
+                if next_begin == -1:
+                    break
+                card_start = next_begin
+                next_begin = self._find_marker(self.BEGIN_MARKER, self._line_end(card_start))
+                continue
+
+            end = self._find_marker(self.END_MARKER, self._line_end(card_start))
+            if end != -1 and (next_begin == -1 or end < next_begin):
+                card_end = self._line_end(end)
+                yield card_start, card_end
+                card_start = -1
+                if next_begin != -1 and next_begin < card_end:
+                    next_begin = self._find_marker(self.BEGIN_MARKER, card_end)
+            elif next_begin != -1:
+                # A new card begins before this one was closed
+                yield card_start, next_begin
+                card_start = next_begin
+                next_begin = self._find_marker(self.BEGIN_MARKER, self._line_end(card_start))
+            else:
+                yield card_start, size
+                break
+
+    def _find_marker(self, marker, pos):
+        return _find_line_marker(self._map, marker, pos)
+
+    def _line_end(self, pos):
+        """Offset just past the line break of the line containing pos"""
+        buf = self._map
+        newline = self._find_byte(b'\n', pos)
+        carriage = self._find_byte(b'\r', pos)
+        if carriage != -1 and (newline == -1 or carriage < newline):
+            return carriage + 2 if buf[carriage + 1:carriage + 2] == b'\n' else carriage + 1
+        return len(buf) if newline == -1 else newline + 1
+
+    def _find_byte(self, byte, pos):
+        """bytes.find that remembers its last hit, since the scan only moves forward.
+
+        Without this, looking for a line ending style the file does not use
+        would rescan the rest of the file for every card.
+        """
+        searched_from, found = self._byte_hits.get(byte, (None, -1))
+        if searched_from is None or pos < searched_from or (found != -1 and found < pos):
+            found = self._map.find(byte, pos)
+            self._byte_hits[byte] = (pos, found)
+        return found
+
+class _EntryTooLarge(Exception):
+    pass
+
+class _LimitedWriter:
+    """File wrapper for pickle.dump that gives up once limit bytes are written"""
+
+    def __init__(self, f, limit):
+        self.f = f
+        self.limit = limit
+        self.written = 0
+
+    def write(self, data):
+        self.written += len(data)
+        if self.written > self.limit:
+            raise _EntryTooLarge()
+        return self.f.write(data)
+
+class VcfParseCache:
+    """On-disk cache of parsed contacts, one pickled ContactStore per source file.
+
+    An entry is valid while the source file's size, mtime and content
+    fingerprint are unchanged. Least recently used entries are evicted once
+    the cache directory grows past max_bytes.
+    """
+    # Bump whenever the pickled ContactStore layout changes
+    FORMAT_VERSION = 12
+    FINGERPRINT_BLOCK = 64 * 1024
+
+    def __init__(self, cache_dir=PARSE_CACHE_DIR, max_bytes=PARSE_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        # Why the last store did not cache its file, or None
+        self.last_error = None
+
+    def parse(self, file_path, parser=None, previous=None, progress=None):
+        """Return the ContactStore of file_path, parsing it only on a cache miss.
+
+        previous, a ContactStore of an earlier version of the file, saves
+        parsing the cards it already holds if both have card hashes, see
+        ContactStore.updated. progress, if given, is called as
+        progress(done, total) while parsing and may raise to stop it.
+        """
+        parser = parser or VcfParser()
+        self.last_error = None
+        contacts = self.load(file_path, parser.fields)
+        if contacts is None:
+            if previous is not None and previous.has_card_hashes() and 'hash' in parser.fields:
+                card_index = VcfCardIndex(file_path)
+                try:
+                    contacts = previous.updated(card_index, parser, progress)
+                finally:
+                    card_index.close()
+            if contacts is None:
+                contacts = ContactStore(parser.parse_vcf_file(file_path, progress=progress))
+            self.store(file_path, contacts, parser.fields)
+        return contacts
+
+    def load(self, file_path, fields=VcfParser.DEFAULT_FIELDS):
+        """Cached ContactStore for file_path, or None if missing or stale.
+
+        Contacts parsed with different VcfParser fields are cached separately.
+        """
+        entry_path = self._entry_path(file_path, fields)
+        try:
+            with open(entry_path, 'rb') as f:
+                header = pickle.load(f)
+                if header != self._header(file_path):
+                    return None
+                contacts = pickle.load(f)
+            # Refresh the entry's age for LRU eviction
+            os.utime(entry_path)
+            return contacts
+        except Exception:
+            return None
+
+    def store(self, file_path, contacts, fields=VcfParser.DEFAULT_FIELDS):
+        """Write a ContactStore for file_path and return whether it was cached.
+
+        Entries that would not fit in max_bytes on their own are not written.
+        Failures only cost a future re-parse; the reason is kept in last_error.
+        """
+        self.last_error = None
+        try:
+            contacts.build_keys()
+            os.makedirs(self.cache_dir, exist_ok=True)
+            header = self._header(file_path)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    writer = _LimitedWriter(f, self.max_bytes)
+                    pickle.dump(header, writer, pickle.HIGHEST_PROTOCOL)
+                    pickle.dump(contacts, writer, pickle.HIGHEST_PROTOCOL)
+                entry_path = self._entry_path(file_path, fields)
+                os.replace(tmp_path, entry_path)
+            except Exception:
+                os.remove(tmp_path)
+                raise
+            self.evict(keep=entry_path)
+            return True
+        except _EntryTooLarge:
+            self.last_error = "Not cached, too large for the parse cache"
+        except Exception as e:
+            self.last_error = f"Parse cache error: {e}"
+        return False
+
+    def invalidate(self, file_path):
+        """Drop the cached entries for one file"""
+        prefix = self._path_key(file_path)
+        for entry_path, _, _ in self._entries():
+            if os.path.basename(entry_path).startswith(prefix):
+                os.remove(entry_path)
+
+    def clear(self):
+        """Drop every cached entry"""
+        for entry_path, _, _ in self._entries():
+            os.remove(entry_path)
+
+    def evict(self, keep=None):
+        """Remove least recently used entries until the cache fits in max_bytes.
+
+        The entry at keep, the one just written, is never removed.
+        """
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        for entry_path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            if entry_path == keep:
+                continue
+            os.remove(entry_path)
+            total -= size
+
+    def _entries(self):
+        if not os.path.isdir(self.cache_dir):
+            return []
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.cache'):
+                stat = os.stat(os.path.join(self.cache_dir, name))
+                entries.append((os.path.join(self.cache_dir, name), stat.st_size, stat.st_mtime))
+        return entries
+
+    def _path_key(self, file_path):
+        return hashlib.sha1(os.path.abspath(file_path).encode('utf-8')).hexdigest()
+
+    def _entry_path(self, file_path, fields):
+        fields_key = hashlib.sha1(','.join(sorted(fields)).encode('utf-8')).hexdigest()[:8]
+        return os.path.join(self.cache_dir, f"{self._path_key(file_path)}-{fields_key}.cache")
+
+    def _header(self, file_path):
+        stat = os.stat(file_path)
+        return (self.FORMAT_VERSION, os.path.abspath(file_path), stat.st_size,
+                stat.st_mtime_ns, self._fingerprint(file_path, stat.st_size))
+
+    def _fingerprint(self, file_path, size):
+        """Hash of the head, middle and tail of the file (all of it if small).
+
+        Sampling keeps validation in the milliseconds for large files; edits
+        that keep size and mtime unchanged are still very likely to be seen.
+        """
+        block = self.FINGERPRINT_BLOCK
+        digest = hashlib.blake2b(digest_size=16)
+        with open(file_path, 'rb') as f:
+            if size <= 3 * block:
+                digest.update(f.read())
+            else:
+                for offset in (0, size // 2 - block // 2, size - block):
+                    f.seek(offset)
+                    digest.update(f.read(block))
+        return digest.hexdigest()
+
+def _find_line_marker(buf, marker, pos):
+    """Offset of the next line starting with marker (after blanks), or -1"""
+    while True:
+        found = buf.find(marker, pos)
+        if found == -1:
+            return -1
+        line_start = found
+        while line_start > 0 and buf[line_start - 1] in b' \t':
+            line_start -= 1
+        if line_start == 0 or buf[line_start - 1] in b'\r\n':
+            return line_start
+        pos = found + len(marker)
+
+def _split_vcf_ranges(file_path, parts):
+    """Cut a file into about `parts` byte ranges that each start on a BEGIN:VCARD line"""
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        size = len(buf)
+        bounds = [0]
+        for k in range(1, parts):
+            pos = _find_line_marker(buf, VcfCardIndex.BEGIN_MARKER, max(size * k // parts, bounds[-1]))
+            if pos == -1:
+                break
+            if pos > bounds[-1]:
+                bounds.append(pos)
+    bounds.append(size)
+    return list(zip(bounds, bounds[1:]))
+
+def _parse_vcf_range(parser, file_path, start, end, at_eof):
+    """Process pool worker for VcfParser.parse_vcf_file, returns (contacts, card_count)"""
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return parser._parse_span(data, at_eof)
+
+def write_card(f, lines, newline):
+    """Write the lines of one card, with PHOTO continuation lines re-indented.
+
+    Lines are written as the bytes they were read as, whatever their
+    charset, each ended with newline, which writers pass as the
+    platform's line ending.
+    """
+    in_photo = False
+    for line in lines:
+        stripped_line = line.strip()
+        
+        if stripped_line == b'':
+            f.write(newline)
+            continue
+            
+        if stripped_line.upper().startswith(b'PHOTO'):
+            f.write(stripped_line + newline)
+            in_photo = True
+        elif in_photo:
+            # The photo ends at the next property; base64 has no ':'
+            if stripped_line.startswith(b'END:VCARD') or (line[:1] not in (b' ', b'\t') and b':' in line):
+                f.write(line + newline)
+                in_photo = False
+            else:
+                f.write(b' ' + line.lstrip() + newline)
+        else:
+            f.write(line + newline)
+
+class VcfMerger:
+    """Merges each group of duplicate cards into one card.
+
+    The merged card is the card with the longest name key, with the TELs of
+    the other cards that it lacks added after its own TELs and the largest
+    PHOTO of the group as its last property. Groups are merged and written
+    one at a time, so memory holds the cards of one group, never every
+    merged card.
+    """
+    # vCard 2.1 writes ENCODING=BASE64, 3.0 ENCODING=b
+    BASE64_ENCODING_RE = re.compile(rb'ENCODING=(?:BASE64|B)(?=;|$)', re.I)
+
+    def __init__(self, country_code=DEFAULT_COUNTRY_CODE, suffix_digits=None):
+        self.phone_key_options = (country_code, suffix_digits)
+        self.parser = VcfParser()
+
+    def write_merged(self, file_path, store, rows, groups, card_index=None):
+        """Write the cards of rows to file_path, each group as one merged card.
+
+        A group is written where its first row comes in rows, and its other
+        rows are skipped. Cards the store did not keep, or kept without
+        their PHOTO, are read from card_index. Returns the number of cards
+        written.
+        """
+        group_of = {row: group for group in groups for row in group}
+        name_keys = store.name_keys
+        written = 0
+        newline = os.linesep.encode()
+        with open(file_path, 'wb') as f:
+            for row in rows:
+                group = group_of.get(row)
+                if group is None:
+                    lines = self._card_lines(store, row, card_index)
+                elif group:
+                    # The longest name is the most complete one
+                    best = max(group, key=lambda other: len(name_keys[other]))
+                    others = [other for other in group if other != best]
+                    lines = self.merge_cards([self._card_lines(store, other, card_index) for other in [best] + others])
+                    for other in group:
+                        group_of[other] = ()
+                else:
+                    continue
+                write_card(f, lines, newline)
+                written += 1
+        return written
+
+    @staticmethod
+    def _card_lines(store, row, card_index):
+        card = store.cards[row]
+        # Kept cards lack their PHOTO
+        if card is not None and not store.has_flag(row, ContactStore.HAS_PHOTO):
+            return VcfParser.card_lines(card)
+        return card_index.card_lines(store.card_nos[row])
+
+    def merge_cards(self, cards):
+        """The lines of one card merged from the lines of several, kept in the first"""
+        cards = [(lines, self._properties(lines)) for lines in cards]
+        base_lines, base_properties = cards[0]
+
+        # TELs of the other cards whose key the merged card does not have yet
+        phone_keys = set()
+        tel_end = None
+        for name, params, value, start, end in base_properties:
+            if name.startswith(b'TEL'):
+                phone_keys.add(self._phone_key(params, value))
+                tel_end = end
+        extra_tels = []
+        for lines, properties in cards:
+            if lines is base_lines:
+                continue
+            for name, params, value, start, end in properties:
+                if name.startswith(b'TEL'):
+                    key = self._phone_key(params, value)
+                    if key and key not in phone_keys:
+                        phone_keys.add(key)
+                        extra_tels.extend(lines[start:end])
+
+        # The largest PHOTO, by the length of its encoded payload
+        photo = []
+        photo_size = 0
+        skipped = set()
+        for lines, properties in cards:
+            for name, params, value, start, end in properties:
+                if name.startswith(b'PHOTO'):
+                    if lines is base_lines:
+                        skipped.update(range(start, end))
+                    size = len(value.strip()) + sum(len(line.strip()) for line in lines[start + 1:end])
+                    if size > photo_size:
+                        photo = lines[start:end]
+                        photo_size = size
+                        photo_version = self._version(properties)
+        if photo and photo_version != self._version(base_properties):
+            photo = [self._photo_encoding(photo[0], self._version(base_properties))] + photo[1:]
+
+        # write_card reads every line after a PHOTO as part of it, so the
+        # photo goes right before END:VCARD
+        card_end = base_properties[-1][4] if base_properties else len(base_lines)
+        if tel_end is None:
+            tel_end = card_end
+        merged = []
+        for line_no, line in enumerate(base_lines):
+            if line_no == tel_end:
+                merged.extend(extra_tels)
+            if line_no == card_end:
+                merged.extend(photo)
+            if line_no not in skipped:
+                merged.append(line)
+        if tel_end == len(base_lines):
+            merged.extend(extra_tels)
+        if card_end == len(base_lines):
+            merged.extend(photo)
+        return merged
+
+    def _properties(self, lines):
+        """(name, params, value, start, end) of every property of a card.
+
+        The property is lines[start:end]: its own lines, continuation lines
+        and PHOTO payload lines. The last one ends at END:VCARD.
+        """
+        tokens = list(self.parser.tokenize(lines))
+        card_end = len(lines)
+        for line_no in range(len(lines) - 1, -1, -1):
+            if lines[line_no].lstrip().upper().startswith(b'END:VCARD'):
+                card_end = line_no
+                break
+        ends = [token[3] for token in tokens[1:]] + [card_end]
+        return [(name, params, value, start, end) for (name, params, value, start), end in zip(tokens, ends)]
+
+    @staticmethod
+    def _version(properties):
+        for name, params, value, start, end in properties:
+            if name == b'VERSION':
+                return value.strip()
+        return b'2.1'
+
+    @classmethod
+    def _photo_encoding(cls, line, version):
+        """A PHOTO line with its base64 ENCODING spelled the way version spells it"""
+        key, colon, value = line.partition(b':')
+        encoding = b'ENCODING=BASE64' if version == b'2.1' else b'ENCODING=b'
+        return cls.BASE64_ENCODING_RE.sub(encoding, key) + colon + value
+
+    def _phone_key(self, params, value):
+        return normalize_phone(VcfParser._property_text(params, value), *self.phone_key_options)
+
+class ExcelExporter:
+    """Class to handle Excel export functionality"""
+    
+    @staticmethod
+    def export_contacts_to_excel(contacts, file_path, sheet_name="Contacts", include_metadata=True):
+        """Export contacts to Excel file"""
+        if not EXCEL_AVAILABLE:
+            raise ImportError("openpyxl library is required for Excel export. Install it with: pip install openpyxl")
+        
+        wb = Workbook()
+        ws = wb.active
+        ws.title = sheet_name
+        
+        # Define headers
+        headers = ['#', 'Name', 'Phone', 'Additional Phones', 'Has Photo']
+        
+        # Style the headers
+        header_font = Font(bold=True, color="FFFFFF")
+        header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+        header_alignment = Alignment(horizontal="center", vertical="center")
+        
+        # Write headers
+        for col, header in enumerate(headers, 1):
+            cell = ws.cell(row=1, column=col, value=header)
+            cell.font = header_font
+            cell.fill = header_fill
+            cell.alignment = header_alignment
+        
+        # Write contact data
+        for row, contact in enumerate(contacts, 2):
+            ws.cell(row=row, column=1, value=row-1)  # Index
+            ws.cell(row=row, column=2, value=contact.name)
+            ws.cell(row=row, column=3, value=contact.phone or "No Phone")
+            ws.cell(row=row, column=4, value=contact.additional_phones or "-")
+            ws.cell(row=row, column=5, value="Yes" if contact.has_photo else "No")
+        
+        # Auto-adjust column widths
+        for col in range(1, len(headers) + 1):
+            column_letter = get_column_letter(col)
+            max_length = 0
+            for row in range(1, len(contacts) + 2):
+                cell_value = str(ws.cell(row=row, column=col).value or "")
+                if len(cell_value) > max_length:
+                    max_length = len(cell_value)
+            # Set column width with some padding
+            ws.column_dimensions[column_letter].width = min(max_length + 2, 50)
+        
+        # Add metadata if requested
+        if include_metadata:
+            metadata_row = len(contacts) + 3
+            ws.cell(row=metadata_row, column=1, value="Export Information:")
+            ws.cell(row=metadata_row, column=1).font = Font(bold=True)
+            
+            ws.cell(row=metadata_row + 1, column=1, value=f"Total Contacts: {len(contacts)}")
+            ws.cell(row=metadata_row + 2, column=1, value=f"Export Date: 2025-06-10 01:00:27 UTC")
+            ws.cell(row=metadata_row + 3, column=1, value="Exported by: VCF Viewer Tool")
+            ws.cell(row=metadata_row + 4, column=1, value="Created by: CodeMasters360")
+        
+        # Save the workbook
+        wb.save(file_path)
+    
+    @staticmethod
+    def export_comparison_to_excel(comparison_results, file_path, match_method, phone_filter):
+        """Export comparison results to Excel with multiple sheets"""
+        if not EXCEL_AVAILABLE:
+            raise ImportError("openpyxl library is required for Excel export. Install it with: pip install openpyxl")
+        
+        wb = Workbook()
+        
+        # Remove default sheet
+        wb.remove(wb.active)
+        
+        # Create summary sheet
+        summary_ws = wb.create_sheet("Summary")
+        ExcelExporter._create_summary_sheet(summary_ws, comparison_results, match_method, phone_filter)
+        
+        # Create sheets for each category
+        if comparison_results['only_in_file1']:
+            file1_ws = wb.create_sheet("Only in File 1")
+            ExcelExporter._create_contacts_sheet(file1_ws, comparison_results['only_in_file1'], "Only in File 1")
+        
+        if comparison_results['only_in_file2']:
+            file2_ws = wb.create_sheet("Only in File 2")
+            ExcelExporter._create_contacts_sheet(file2_ws, comparison_results['only_in_file2'], "Only in File 2")
+        
+        if comparison_results['common']:
+            common_ws = wb.create_sheet("Common Contacts")
+            ExcelExporter._create_common_contacts_sheet(common_ws, comparison_results['common'])
+        
+        wb.save(file_path)
+    
+    @staticmethod
+    def _create_summary_sheet(ws, results, match_method, phone_filter):
+        """Create summary sheet for comparison results"""
+        # Title
+        ws.cell(row=1, column=1, value="VCF File Comparison Summary")
+        ws.cell(row=1, column=1).font = Font(size=16, bold=True)
+        
+        # Comparison details
+        ws.cell(row=3, column=1, value="Comparison Details:")
+        ws.cell(row=3, column=1).font = Font(bold=True)
+        ws.cell(row=4, column=1, value=f"Match Method: {match_method}")
         ws.cell(row=5, column=1, value=f"Phone Filter: {phone_filter}")
         
         # File statistics
@@ -375,105 +1819,871 @@ class ExcelExporter:
                     max_length = len(cell_value)
             ws.column_dimensions[column_letter].width = min(max_length + 2, 40)
 
-class VcfComparator:
-    def __init__(self):
-        self.file1_path = ""
-        self.file2_path = ""
-        self.file1_contacts = []
-        self.file2_contacts = []
+    @staticmethod
+    def export_multi_comparison_to_excel(comparison_results, file_names, file_path, match_method, phone_filter):
+        """Export the results of VcfComparator.compare_many to Excel with multiple sheets"""
+        if not EXCEL_AVAILABLE:
+            raise ImportError("openpyxl library is required for Excel export. Install it with: pip install openpyxl")
         
-    def normalize_phone(self, phone):
-        """Normalize phone number for comparison"""
-        if not phone:
-            return ""
-        # Remove common phone number separators and spaces
-        normalized = ''.join(c for c in phone if c.isdigit() or c == '+')
-        # Remove leading zeros and country codes for better matching
-        if normalized.startswith('+'):
-            return normalized
-        return normalized.lstrip('0')
-    
-    def normalize_name(self, name):
-        """Normalize name for comparison"""
-        if not name:
-            return ""
-        return name.lower().strip().replace('ي', 'ی').replace('ك', 'ک')
-    
-    def contacts_match(self, contact1, contact2, match_method):
-        """Check if two contacts match based on the selected method"""
-        if match_method == "Name + Phone":
-            return (self.normalize_name(contact1.name) == self.normalize_name(contact2.name) and 
-                    self.normalize_phone(contact1.phone) == self.normalize_phone(contact2.phone))
-        elif match_method == "Name Only":
-            return self.normalize_name(contact1.name) == self.normalize_name(contact2.name)
-        elif match_method == "Phone Only":
-            return self.normalize_phone(contact1.phone) == self.normalize_phone(contact2.phone)
-        return False
-    
-    def find_contact_in_list(self, target_contact, contact_list, match_method):
-        """Find if a contact exists in a list using the specified matching method"""
-        for contact in contact_list:
-            if self.contacts_match(target_contact, contact, match_method):
-                return contact
-        return None
-    
-    def filter_contacts_by_phone(self, contacts, phone_filter):
-        """Filter contacts based on phone number criteria"""
-        if phone_filter == "All Contacts":
-            return contacts
-        elif phone_filter == "With Phone Only":
-            return [c for c in contacts if c.phone and c.phone.strip()]
-        elif phone_filter == "Without Phone Only":
-            return [c for c in contacts if not c.phone or not c.phone.strip()]
-        else:
-            return contacts
-    
-    def compare_files(self, file1_contacts, file2_contacts, match_method="Name + Phone", phone_filter="All Contacts"):
-        """Compare two lists of contacts and return differences"""
-        # Apply phone filter to both contact lists before comparison
-        filtered_file1_contacts = self.filter_contacts_by_phone(file1_contacts, phone_filter)
-        filtered_file2_contacts = self.filter_contacts_by_phone(file2_contacts, phone_filter)
+        wb = Workbook()
+        wb.remove(wb.active)
         
-        self.file1_contacts = filtered_file1_contacts
-        self.file2_contacts = filtered_file2_contacts
+        # Summary sheet
+        ws = wb.create_sheet("Summary")
+        ws.cell(row=1, column=1, value="VCF Multi-File Comparison Summary")
+        ws.cell(row=1, column=1).font = Font(size=16, bold=True)
+        ws.cell(row=3, column=1, value="Comparison Details:")
+        ws.cell(row=3, column=1).font = Font(bold=True)
+        ws.cell(row=4, column=1, value=f"Match Method: {match_method}")
+        ws.cell(row=5, column=1, value=f"Phone Filter: {phone_filter}")
+        ws.cell(row=7, column=1, value="File Statistics:")
+        ws.cell(row=7, column=1).font = Font(bold=True)
+        row = 8
+        for name, total, filtered in zip(file_names, comparison_results['file_totals'], comparison_results['file_filtered']):
+            ws.cell(row=row, column=1, value=f"{name}: {total} contacts, {filtered} compared")
+            row += 1
+        row += 1
+        ws.cell(row=row, column=1, value="Comparison Results:")
+        ws.cell(row=row, column=1).font = Font(bold=True)
+        ws.cell(row=row + 1, column=1, value=f"Distinct contacts: {len(comparison_results['groups'])}")
+        ws.cell(row=row + 2, column=1, value=f"In all files: {len(comparison_results['in_all_files'])}")
+        ws.cell(row=row + 3, column=1, value=f"In one file only: {len(comparison_results['in_one_file'])}")
+        ws.column_dimensions['A'].width = 60
         
-        # Find contacts only in file1
-        only_in_file1 = []
-        for contact in filtered_file1_contacts:
-            if not self.find_contact_in_list(contact, filtered_file2_contacts, match_method):
-                only_in_file1.append(contact)
+        if comparison_results['in_all_files']:
+            ExcelExporter._create_contacts_sheet(
+                wb.create_sheet("In All Files"),
+                [group[0][1] for group in comparison_results['in_all_files']], "In All Files")
         
-        # Find contacts only in file2
-        only_in_file2 = []
-        for contact in filtered_file2_contacts:
-            if not self.find_contact_in_list(contact, filtered_file1_contacts, match_method):
-                only_in_file2.append(contact)
+        if comparison_results['in_one_file']:
+            ExcelExporter._create_contacts_sheet(
+                wb.create_sheet("In One File Only"),
+                [group[0][1] for group in comparison_results['in_one_file']], "In One File Only")
         
-        # Find common contacts
-        common_contacts = []
-        for contact in filtered_file1_contacts:
-            match = self.find_contact_in_list(contact, filtered_file2_contacts, match_method)
-            if match:
-                common_contacts.append((contact, match))
+        if comparison_results['groups']:
+            ExcelExporter._create_presence_sheet(
+                wb.create_sheet("Presence"), comparison_results['groups'],
+                comparison_results['file_sets'], file_names)
         
-        return {
-            'only_in_file1': only_in_file1,
-            'only_in_file2': only_in_file2,
-            'common': common_contacts,
-            'file1_total': len(file1_contacts),
-            'file2_total': len(file2_contacts),
-            'file1_filtered': len(filtered_file1_contacts),
-            'file2_filtered': len(filtered_file2_contacts),
-            'phone_filter': phone_filter
-        }
-
-class SortableTreeWidget(QTreeWidget):
-    """Custom TreeWidget with sorting functionality"""
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self.sort_column = 0
-        self.sort_order = Qt.SortOrder.AscendingOrder
-        self.original_data = []
+        wb.save(file_path)
+    
+    @staticmethod
+    def _create_presence_sheet(ws, groups, file_sets, file_names):
+        """Create a sheet with the files each contact of an N-way comparison is in"""
+        headers = ['#', 'Name', 'Phone'] + list(file_names) + ['Files']
+        
+        # Style the headers
+        header_font = Font(bold=True, color="FFFFFF")
+        header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+        
+        for col, header in enumerate(headers, 1):
+            cell = ws.cell(row=1, column=col, value=header)
+            cell.font = header_font
+            cell.fill = header_fill
+        
+        for row, (group, files) in enumerate(zip(groups, file_sets), 2):
+            contact = group[0][1]
+            ws.cell(row=row, column=1, value=row-1)
+            ws.cell(row=row, column=2, value=contact.name)
+            ws.cell(row=row, column=3, value=contact.phone or "No Phone")
+            for file_index in files:
+                ws.cell(row=row, column=4 + file_index, value="✓")
+            ws.cell(row=row, column=len(headers), value=len(files))
+        
+        # Names and phones set the width, file columns stay narrow
+        for col, header in enumerate(headers, 1):
+            width = 12
+            if col in (2, 3):
+                width = max([len(str(ws.cell(row=row, column=col).value or "")) for row in range(1, len(groups) + 2)])
+            ws.column_dimensions[get_column_letter(col)].width = min(max(width, len(header)) + 2, 40)
+
+class SimilarNameState:
+    """"Similar Name" matches of one comparison, kept for the next one.
+
+    Every name of file 1 is paired with the most similar name of file 2
+    (the first one on ties) by edit_similarity that reaches threshold.
+    Scoring every pair is quadratic, so names are indexed by the
+    one_deletion_variants of their fuzzy_name_key, and a name is only
+    scored against the names it shares a variant with, which holds every
+    name within one typo once case, spacing and letter variants are
+    folded. Names further apart than that are not compared.
+
+    Matches depend on nothing but the names, so they are kept per distinct
+    name key. update() takes the name keys of the compared rows and scores
+    only the names that were added or removed since the last call; the
+    others keep their matches. Scoring is the slow part of a "Similar
+    Name" comparison, so comparing files again after a few cards were
+    edited is a small part of the work.
+    """
+    def __init__(self, threshold=SIMILAR_NAME_THRESHOLD):
+        self.threshold = threshold
+        self.reset()
+
+    def reset(self):
+        # Number of rows with each name in file 1 and file 2
+        self.count1 = {}
+        self.count2 = {}
+        # Names of file 2 in the order they first appear, and that position
+        self.order2 = []
+        self.first2 = {}
+        # The names of both files by one_deletion_variants of their
+        # fuzzy_name_key
+        self.postings = {}
+        # (name, similarity) of the match of every name of file 1, or None
+        self.best = {}
+        # Number of names of file 1 similar to every name of file 2
+        self.hits2 = {}
+
+    def update(self, names1, names2, progress=None):
+        """Match the normalize_name keys names1 against names2.
+
+        Returns the position in names2 of the match of every name of names1
+        (None if it has none) and the set of positions in names2 that match
+        anything, like VcfComparator.key_matches. Scoring is the slow part,
+        so progress, if given, is called as progress("Matching", percent)
+        every 4096 names scored.
+        """
+        count1 = Counter(names1)
+        count2 = Counter(names2)
+        order2 = list(count2)
+        first2 = dict(zip(reversed(names2), range(len(names2) - 1, -1, -1)))
+
+        removed1 = [name for name in self.count1 if name not in count1]
+        # A name of file 2 that now appears a different number of times may
+        # have moved, so it is scored again like a new one
+        changed2 = {name for name, count in self.count2.items() if count2.get(name) != count}
+        kept = len(self.count1) - len(removed1) + len(self.count2) - len(changed2)
+        if (kept * 2 < len(count1) + len(count2) or
+                [name for name in self.order2 if name not in changed2] !=
+                [name for name in order2 if name in self.count2 and name not in changed2]):
+            # Mostly other files, or moved cards, which can change which of
+            # two equally similar names comes first
+            self.reset()
+            removed1 = []
+            changed2 = set()
+
+        # Names of either file stay in postings until they leave both
+        old_count1 = self.count1
+        old_count2 = self.count2
+        best = self.best
+        hits2 = self.hits2
+        # Names of file 1 whose match was removed
+        dirty = set()
+        for name in removed1:
+            for other in self._similar(name, old_count2):
+                hits2[other] -= 1
+            del best[name]
+        for name in changed2:
+            dirty.update(
+                other for other in self._candidates(name, best)
+                if best[other] and best[other][0] == name
+            )
+            del hits2[name]
+        for name in changed2.union(removed1):
+            if name not in count1 and name not in count2:
+                for variant in self._variants(name):
+                    names = self.postings[variant]
+                    names.remove(name)
+                    if not names:
+                        del self.postings[variant]
+
+        self.count1 = count1
+        self.count2 = count2
+        self.order2 = order2
+        self.first2 = first2
+        for name in order2:
+            if name in hits2:
+                continue
+            if name not in old_count1 and name not in old_count2:
+                self._add(name)
+            position = first2[name]
+            similar = self._similar(name, best) if best else {}
+            for other, similarity in similar.items():
+                match = best[other]
+                if other not in dirty and (match is None or similarity > match[1] or
+                                           (similarity == match[1] and position < first2[match[0]])):
+                    best[other] = (name, similarity)
+            hits2[name] = len(similar)
+
+        # New names of file 1 are scored along with the dirty ones, in file
+        # order, which keeps the names scored together close in memory
+        dirty = [name for name in count1 if name in dirty or name not in best]
+        for done, name in enumerate(dirty):
+            if progress and not done % 4096:
+                progress("Matching", 70 + 20 * done // len(dirty))
+            added = name not in best
+            if added and name not in old_count2 and name not in count2:
+                self._add(name)
+            best[name] = self._best(name, added)
+        return self.matches(names1, names2)
+
+    def matches(self, names1, names2):
+        """The matches and matched positions of update() for these rows"""
+        first2 = self.first2
+        best = self.best
+        hits2 = self.hits2
+        matches = [first2[best[name][0]] if best[name] else None for name in names1]
+        matched = {position for position, name in enumerate(names2) if hits2[name]}
+        return matches, matched
+
+    @staticmethod
+    def _variants(name):
+        key = fuzzy_name_key(name)
+        return one_deletion_variants(key) if key else ()
+
+    def _add(self, name):
+        for variant in self._variants(name):
+            self.postings.setdefault(variant, []).append(name)
+
+    def _candidates(self, name, names):
+        """The names sharing a variant with name that are keys of names"""
+        candidates = set()
+        no_postings = ()
+        for variant in self._variants(name):
+            candidates.update(self.postings.get(variant, no_postings))
+        return [other for other in candidates if other in names]
+
+    def _similar(self, name, names):
+        """Similarity to name of the keys of names that reach threshold, by name"""
+        threshold = self.threshold
+        key = fuzzy_name_key(name)
+        similar = {}
+        for other in self._candidates(name, names):
+            similarity = edit_similarity(key, fuzzy_name_key(other))
+            if similarity >= threshold:
+                similar[other] = similarity
+        return similar
+
+    def _best(self, name, added):
+        """(name, similarity) of the match of a name of file 1, counted in hits2 if added"""
+        threshold = self.threshold
+        first2 = self.first2
+        hits2 = self.hits2
+        key = fuzzy_name_key(name)
+        best = None
+        best_similarity = 0.0
+        for other in self._candidates(name, first2):
+            similarity = edit_similarity(key, fuzzy_name_key(other))
+            if similarity >= threshold:
+                if added:
+                    hits2[other] += 1
+                if (best is None or similarity > best_similarity or
+                        (similarity == best_similarity and first2[other] < first2[best])):
+                    best = other
+                    best_similarity = similarity
+        return (best, best_similarity) if best is not None else None
+
+def match_name_phone(store, row):
+    """Keys of "Name + Phone": the name and first phone number together"""
+    return ((store.name_keys[row], store.phone_keys[row]),)
+
+def match_name(store, row):
+    """Keys of "Name Only": the name"""
+    return (store.name_keys[row],)
+
+def match_phone(store, row):
+    """Keys of "Phone Only": the first phone number, so contacts without one match each other"""
+    return (store.phone_keys[row],)
+
+def match_any_phone(store, row):
+    """Keys of "Any Phone": every phone number, so sharing any one of them is a match"""
+    return store.all_phone_keys[row]
+
+# Match methods by the name shown in the Match Method combo boxes, see
+# register_match_method
+MATCH_METHODS = {}
+
+def register_match_method(name, keys=None, by_similarity=False):
+    """Offer a match method in the comparison windows.
+
+    keys(store, row) returns a tuple of the keys row of a ContactStore
+    matches under, read from the store's key columns. Contacts match if
+    they share any key. VcfComparator finds those with one hash index per
+    file, and ExternalVcfComparator with sorted runs, so keys must be
+    strings or tuples of strings. A method registered by_similarity takes
+    no keys and matches names by edit_similarity, see SimilarNameState.
+    """
+    if by_similarity and keys is not None:
+        raise ValueError(f"Match method {name} matches by similarity and takes no keys")
+    if not by_similarity and keys is None:
+        raise ValueError(f"Match method {name} needs a keys function")
+    MATCH_METHODS[name] = keys
+
+register_match_method("Name + Phone", match_name_phone)
+register_match_method("Name Only", match_name)
+register_match_method("Phone Only", match_phone)
+register_match_method("Any Phone", match_any_phone)
+register_match_method("Similar Name", by_similarity=True)
+
+class VcfComparator:
+    def __init__(self):
+        self.file1_path = ""
+        self.file2_path = ""
+        # Options of normalize_phone, see there
+        self.country_code = DEFAULT_COUNTRY_CODE
+        self.suffix_digits = None
+        self.similarity_threshold = SIMILAR_NAME_THRESHOLD
+        # Filtered rows, keys and match indexes of the stores last compared,
+        # see _cached
+        self.store_caches = {}
+        # SimilarNameState of the last comparisons, by phone filter
+        self.similar_name_states = {}
+        
+    def normalize_phone(self, phone):
+        """Normalize phone number for comparison"""
+        return normalize_phone(phone, self.country_code, self.suffix_digits)
+    
+    def normalize_name(self, name):
+        """Normalize name for comparison"""
+        return normalize_name(name)
+    
+    def match_keys(self, match_method):
+        """The keys function of a registered match method, None if it matches by similarity"""
+        if match_method not in MATCH_METHODS:
+            raise ValueError(f"Unknown match method: {match_method}")
+        return MATCH_METHODS[match_method]
+
+    def matches_by_similarity(self, match_method):
+        """Whether a match method was registered by_similarity"""
+        return self.match_keys(match_method) is None
+
+    def contact_keys(self, contact, match_method):
+        """Keys under which a contact matches with the selected method.
+
+        Two contacts match if they share any key. Methods that match by
+        similarity give none.
+        """
+        store = ContactStore((contact,))
+        store.set_phone_key_options(self.country_code, self.suffix_digits)
+        return self.row_keys(store, (0,), match_method)[0]
+
+    def contacts_match(self, contact1, contact2, match_method):
+        """Check if two contacts match based on the selected method"""
+        if self.matches_by_similarity(match_method):
+            key1 = fuzzy_name_key(normalize_name(contact1.name))
+            key2 = fuzzy_name_key(normalize_name(contact2.name))
+            if not key1 or one_deletion_variants(key1).isdisjoint(one_deletion_variants(key2)):
+                return False
+            return edit_similarity(key1, key2) >= self.similarity_threshold
+        return not set(self.contact_keys(contact1, match_method)).isdisjoint(self.contact_keys(contact2, match_method))
+    
+    def row_keys(self, store, rows, match_method):
+        """contact_keys of the given rows of a ContactStore, from its key columns"""
+        keys = self.match_keys(match_method)
+        if keys is None:
+            return [()] * len(rows)
+        return [keys(store, row) for row in rows]
+
+    def find_contact_in_list(self, target_contact, contact_list, match_method):
+        """Find if a contact exists in a list using the specified matching method"""
+        for contact in contact_list:
+            if self.contacts_match(target_contact, contact, match_method):
+                return contact
+        return None
+    
+    def key_index(self, keys2):
+        """The first position in keys2 of every key, for key_matches"""
+        index = {}
+        for position, keys in enumerate(keys2):
+            for key in keys:
+                index.setdefault(key, position)
+        return index
+
+    def key_matches(self, keys1, keys2, index=None):
+        """Match two lists of contact key tuples with one hash index.
+
+        Returns the position in keys2 of the match of every entry of keys1
+        (None if it has none) and the set of positions in keys2 that match
+        anything. An entry is paired with the first entry of keys2 sharing
+        any of its keys, as a scan with contacts_match would find. index is
+        the key_index of keys2, built here if not given.
+        """
+        if index is None:
+            index = self.key_index(keys2)
+        
+        matches = []
+        keys1_set = set()
+        for keys in keys1:
+            match = None
+            for key in keys:
+                position = index.get(key)
+                if position is not None and (match is None or position < match):
+                    match = position
+            matches.append(match)
+            keys1_set.update(keys)
+        
+        matched = {
+            position for position, keys in enumerate(keys2)
+            if not keys1_set.isdisjoint(keys)
+        }
+        return matches, matched
+
+    def group_keys(self, keys_per_file):
+        """Group the contacts of several files by shared keys with one index.
+
+        keys_per_file holds the contact key tuples of each file. Returns the
+        group number of every contact, per file, and the number of groups.
+        A contact joins the earliest group any of its keys belongs to, and
+        one without keys starts a group of its own.
+        """
+        index = {}
+        groups_per_file = []
+        group_count = 0
+        for keys_list in keys_per_file:
+            groups = []
+            for keys in keys_list:
+                group = None
+                for key in keys:
+                    found = index.get(key)
+                    if found is not None and (group is None or found < group):
+                        group = found
+                if group is None:
+                    group = group_count
+                    group_count += 1
+                for key in keys:
+                    index.setdefault(key, group)
+                groups.append(group)
+            groups_per_file.append(groups)
+        return groups_per_file, group_count
+
+    def similar_name_groups(self, names_per_file):
+        """Group the name keys of several files by edit_similarity, like group_keys.
+
+        A name joins the group whose first name is the most similar to it
+        (the earliest on ties) at similarity_threshold or above. As in
+        SimilarNameState, only groups whose first name shares one of its
+        one_deletion_variants are scored.
+        """
+        threshold = self.similarity_threshold
+        index = {}
+        group_keys = []
+        groups_per_file = []
+        no_postings = ()
+        for names in names_per_file:
+            groups = []
+            for name in names:
+                key = fuzzy_name_key(name)
+                variants = one_deletion_variants(key) if key else ()
+                candidates = set()
+                for variant in variants:
+                    candidates.update(index.get(variant, no_postings))
+                best = None
+                best_similarity = 0.0
+                for group in sorted(candidates):
+                    similarity = edit_similarity(key, group_keys[group])
+                    if similarity >= threshold and (best is None or similarity > best_similarity):
+                        best = group
+                        best_similarity = similarity
+                if best is None:
+                    best = len(group_keys)
+                    group_keys.append(key)
+                    for variant in variants:
+                        index.setdefault(variant, []).append(best)
+                groups.append(best)
+            groups_per_file.append(groups)
+        return groups_per_file, len(group_keys)
+
+    def filter_contacts_by_phone(self, store, phone_filter):
+        """Rows of a ContactStore that pass the phone number criteria"""
+        rows = store.rows()
+        if phone_filter == "With Phone Only":
+            return store.rows_with_phone(rows)
+        elif phone_filter == "Without Phone Only":
+            return store.rows_with_phone(rows, False)
+        else:
+            return rows
+    
+    def _cached(self, store, key, build):
+        """build() for a store, kept until the store is no longer compared.
+
+        Phone keys depend on the phone options, so keys that hold phone keys
+        include them.
+        """
+        cache = self.store_caches.setdefault(store, {})
+        if key not in cache:
+            cache[key] = build()
+        return cache[key]
+
+    def compare_files(self, file1_contacts, file2_contacts, match_method="Name + Phone", phone_filter="All Contacts",
+                      progress=None):
+        """Compare the contacts of two ContactStores and return differences.
+
+        Filtered rows, keys and the match index of file 2 are kept per
+        store, so comparing the same stores again with another match
+        method or phone filter only rebuilds what that option changes.
+        "Similar Name" matches are kept per name in a SimilarNameState, which
+        also carries them over to edited versions of the files.
+        progress, if given, is called with the name of each stage and the
+        percent of the whole comparison done, see ComparisonThread.
+        """
+        if progress:
+            progress("Indexing", 60)
+        self.store_caches = {
+            store: self.store_caches.get(store, {}) for store in (file1_contacts, file2_contacts)
+        }
+        # Apply phone filter to both stores before comparison
+        file1_contacts.set_phone_key_options(self.country_code, self.suffix_digits)
+        file2_contacts.set_phone_key_options(self.country_code, self.suffix_digits)
+        file1_rows = self._cached(file1_contacts, ('rows', phone_filter),
+                                  lambda: self.filter_contacts_by_phone(file1_contacts, phone_filter))
+        file2_rows = self._cached(file2_contacts, ('rows', phone_filter),
+                                  lambda: self.filter_contacts_by_phone(file2_contacts, phone_filter))
+        # Position in file 2 of the match of each file 1 contact, and the
+        # positions in file 2 that match anything
+        if self.matches_by_similarity(match_method):
+            # The names of the last comparisons with each phone filter keep
+            # their matches, so only added or removed names are scored. A
+            # state is put back only once updated, since a cancelled update
+            # leaves it half done
+            state_key = (phone_filter, self.similarity_threshold)
+            state = self.similar_name_states.pop(state_key, None) or SimilarNameState(self.similarity_threshold)
+            matches, file2_matched = state.update(
+                [file1_contacts.name_keys[row] for row in file1_rows],
+                [file2_contacts.name_keys[row] for row in file2_rows], progress)
+            self.similar_name_states[state_key] = state
+            while len(self.similar_name_states) > SIMILAR_NAME_STATES:
+                del self.similar_name_states[next(iter(self.similar_name_states))]
+        else:
+            phone_key_options = (self.country_code, self.suffix_digits)
+            keys2 = self._cached(file2_contacts, ('keys', match_method, phone_filter, phone_key_options),
+                                 lambda: self.row_keys(file2_contacts, file2_rows, match_method))
+            keys1 = self._cached(file1_contacts, ('keys', match_method, phone_filter, phone_key_options),
+                                 lambda: self.row_keys(file1_contacts, file1_rows, match_method))
+            index = self._cached(file2_contacts, ('index', match_method, phone_filter, phone_key_options),
+                                 lambda: self.key_index(keys2))
+            if progress:
+                progress("Matching", 70)
+            matches, file2_matched = self.key_matches(keys1, keys2, index)
+        
+        # Contacts are built for the result rows only. A file 2 contact
+        # matched by several file 1 contacts is one Contact
+        contact1 = file1_contacts.contact
+        contact2 = file2_contacts.contact
+        only_in_file1 = []
+        common_contacts = []
+        matched_contacts2 = {}
+        for row, match in zip(file1_rows, matches):
+            if match is None:
+                only_in_file1.append(contact1(row))
+            else:
+                other = matched_contacts2.get(match)
+                if other is None:
+                    other = matched_contacts2[match] = contact2(file2_rows[match])
+                common_contacts.append((contact1(row), other))
+        only_in_file2 = [
+            contact2(row) for position, row in enumerate(file2_rows)
+            if position not in file2_matched
+        ]
+        
+        return {
+            'only_in_file1': only_in_file1,
+            'only_in_file2': only_in_file2,
+            'common': common_contacts,
+            'file1_total': len(file1_contacts),
+            'file2_total': len(file2_contacts),
+            'file1_filtered': len(file1_rows),
+            'file2_filtered': len(file2_rows),
+            'match_method': match_method,
+            'phone_filter': phone_filter
+        }
+
+    def compare_many(self, stores, match_method="Name + Phone", phone_filter="All Contacts"):
+        """Compare the contacts of any number of ContactStores in one pass.
+
+        The contacts of all files are grouped with one shared key index, so
+        the cost grows with the total number of contacts. Every group is a
+        list of (file index, Contact) pairs in file order, and file_sets
+        holds the indexes of the files each group was found in.
+        """
+        rows_per_file = []
+        for store in stores:
+            store.set_phone_key_options(self.country_code, self.suffix_digits)
+            rows_per_file.append(self.filter_contacts_by_phone(store, phone_filter))
+        
+        if self.matches_by_similarity(match_method):
+            groups_per_file, group_count = self.similar_name_groups([
+                [store.name_keys[row] for row in rows]
+                for store, rows in zip(stores, rows_per_file)
+            ])
+        else:
+            groups_per_file, group_count = self.group_keys([
+                self.row_keys(store, rows, match_method)
+                for store, rows in zip(stores, rows_per_file)
+            ])
+        
+        groups = [[] for _ in range(group_count)]
+        for file_index, (store, rows, row_groups) in enumerate(zip(stores, rows_per_file, groups_per_file)):
+            for contact, group in zip(store.contacts(rows), row_groups):
+                groups[group].append((file_index, contact))
+        # Files are grouped in order, so each group's indexes are sorted
+        file_sets = [tuple(dict.fromkeys(file_index for file_index, _ in group)) for group in groups]
+        
+        all_files = tuple(range(len(stores)))
+        return {
+            'groups': groups,
+            'file_sets': file_sets,
+            'in_all_files': [group for group, files in zip(groups, file_sets) if files == all_files],
+            'in_one_file': [group for group, files in zip(groups, file_sets) if len(files) == 1],
+            'file_totals': [len(store) for store in stores],
+            'file_filtered': [len(rows) for rows in rows_per_file],
+            'match_method': match_method,
+            'phone_filter': phone_filter
+        }
+
+class ExternalVcfComparator(VcfComparator):
+    """Compares two VCF files that do not fit in memory, by external sort-merge.
+
+    Each file is streamed card by card, and the match key of every compared
+    contact is written with its card number to sorted runs in temporary
+    files once memory_budget bytes of keys are held. The runs of each file
+    are merged into one sorted stream, the two streams are walked together,
+    and the cards whose key shows up in both are flagged. Outputs are then
+    copied straight from the source files, card by card, in file order.
+    Apart from the key budget, memory holds one flag byte per card.
+    """
+    # Cards parsed with one VcfParser._parse_span call
+    PARSE_BATCH_CARDS = 1024
+    # Most records pickled together in a run file, the unit runs are read
+    # back in. Smaller budgets get smaller blocks, see _block_records.
+    RUN_BLOCK_RECORDS = 4096
+    # Most runs merged at once; more are first merged into bigger runs
+    MERGE_FAN_IN = 64
+    # Rough size of a (key, card_no) record beside its key bytes
+    RECORD_OVERHEAD = 120
+    # Flags of a card: it passed the phone filter, and its key is in both files
+    COMPARED = 1
+    MATCHED = 2
+    
+    def __init__(self, memory_budget=EXTERNAL_COMPARE_MEMORY, temp_dir=None):
+        super().__init__()
+        self.memory_budget = memory_budget
+        self.temp_dir = temp_dir
+    
+    def compare_paths(self, file1_path, file2_path, output_paths, match_method="Name + Phone", phone_filter="All Contacts",
+                      progress=None):
+        """Compare two files on disk and write the differences as VCF files.
+
+        output_paths maps 'only_in_file1', 'only_in_file2' and 'common' to
+        the files to write; common contacts are written as their file 1
+        cards. Returns counts in the form of compare_files' results.
+        progress, if given, is called as in compare_files, once per batch
+        of cards read, and may raise to stop the comparison.
+        """
+        if self.matches_by_similarity(match_method):
+            raise ValueError(f"{match_method} cannot be compared on disk, choose a key based match method")
+        
+        parser = VcfParser(fields=('name', 'tel'))
+        index1 = VcfCardIndex(file1_path, scan=False)
+        index2 = VcfCardIndex(file2_path, scan=False)
+        runs1 = runs2 = []
+        # Reading each file takes the first 80 percent between them
+        def reading(stage, start):
+            return progress and (lambda done, size: progress(stage, start + 40 * done // max(size, 1)))
+        try:
+            runs1, flags1, total1 = self._key_runs(index1, parser, match_method, phone_filter,
+                                                   reading("Reading file 1", 0))
+            runs2, flags2, total2 = self._key_runs(index2, parser, match_method, phone_filter,
+                                                   reading("Reading file 2", 40))
+            if progress:
+                progress("Matching", 80)
+            self._mark_matches(self._merge_runs(runs1), self._merge_runs(runs2), flags1, flags2)
+            
+            if progress:
+                progress("Writing results", 90)
+            compared = self.COMPARED
+            matched = self.COMPARED | self.MATCHED
+            counts = {
+                'only_in_file1': self._copy_cards(index1, flags1, compared, output_paths['only_in_file1']),
+                'only_in_file2': self._copy_cards(index2, flags2, compared, output_paths['only_in_file2']),
+                'common': self._copy_cards(index1, flags1, matched, output_paths['common'])
+            }
+        finally:
+            for run in runs1 + runs2:
+                run.close()
+            index1.close()
+            index2.close()
+        
+        return {
+            'only_in_file1': counts['only_in_file1'],
+            'only_in_file2': counts['only_in_file2'],
+            'common': counts['common'],
+            'file1_total': total1,
+            'file2_total': total2,
+            'file1_filtered': len(flags1) - flags1.count(0),
+            'file2_filtered': len(flags2) - flags2.count(0),
+            'match_method': match_method,
+            'phone_filter': phone_filter
+        }
+    
+    def _iter_contacts(self, index, parser, progress=None):
+        """Yield the contacts of an unscanned VcfCardIndex and the card count so far.
+
+        Cards are parsed a batch at a time from the memory map. A batch whose
+        card count does not agree with its spans is parsed card by card.
+        """
+        size = index.size()
+        spans = []
+        card_no = 0
+        for span in index.iter_spans():
+            spans.append(span)
+            if len(spans) == self.PARSE_BATCH_CARDS:
+                if progress:
+                    progress(spans[0][0], size)
+                yield from self._parse_batch(index, parser, spans, card_no, size)
+                card_no += len(spans)
+                spans = []
+        if spans:
+            yield from self._parse_batch(index, parser, spans, card_no, size)
+    
+    def _parse_batch(self, index, parser, spans, first_card_no, size):
+        end = spans[-1][1]
+        contacts, card_count = parser._parse_span(index.span_bytes(spans[0][0], end), end == size, first_card_no)
+        if card_count != len(spans):
+            contacts = []
+            for card_no, (start, end) in enumerate(spans, first_card_no):
+                contacts += parser._parse_span(index.span_bytes(start, end), end == size, card_no)[0]
+        card_count = first_card_no + len(spans)
+        for contact in contacts:
+            yield contact, card_count
+    
+    def _key_runs(self, index, parser, match_method, phone_filter, progress=None):
+        """Sorted runs of (key bytes, card_no) of one file, its card flags and contact count.
+
+        progress, if given, is called as progress(done, size) with the
+        bytes read before each batch of cards.
+        """
+        flags = bytearray()
+        runs = []
+        records = []
+        held = 0
+        total = 0
+        compared = self.COMPARED
+        # Contacts are keyed a batch at a time, from the key columns of one
+        # ContactStore per batch
+        batch = []
+        for contact, card_count in self._iter_contacts(index, parser, progress):
+            total += 1
+            if len(flags) < card_count:
+                flags.extend(bytes(card_count - len(flags)))
+            has_phone = bool(contact.phone and contact.phone.strip())
+            if (phone_filter == "With Phone Only" and not has_phone) or (phone_filter == "Without Phone Only" and has_phone):
+                continue
+            flags[contact.card_no] = compared
+            batch.append(contact)
+            if len(batch) < self.PARSE_BATCH_CARDS:
+                continue
+            held += self._batch_records(batch, match_method, records)
+            batch = []
+            if held >= self.memory_budget:
+                runs.append(self._write_run(records))
+                records = []
+                held = 0
+                if len(runs) >= self.MERGE_FAN_IN:
+                    merged = self._write_run(self._merge_runs(runs), presorted=True)
+                    for run in runs:
+                        run.close()
+                    runs = [merged]
+        self._batch_records(batch, match_method, records)
+        if records or not runs:
+            runs.append(self._write_run(records))
+        return runs, flags, total
+    
+    def _batch_records(self, contacts, match_method, records):
+        """Add the (key bytes, card_no) records of contacts to records, returning their size"""
+        store = ContactStore(contacts)
+        store.set_phone_key_options(self.country_code, self.suffix_digits)
+        size = 0
+        for card_no, keys in zip(store.card_nos, self.row_keys(store, range(len(store)), match_method)):
+            for key in keys:
+                # Phone keys have no line breaks, so this is one to one
+                if isinstance(key, tuple):
+                    key = '\n'.join(key)
+                key = key.encode('utf-8', 'surrogatepass')
+                records.append((key, card_no))
+                size += len(key) + self.RECORD_OVERHEAD
+        return size
+
+    def _write_run(self, records, presorted=False):
+        """Temporary file holding records in sorted order, rewound for reading"""
+        if not presorted:
+            records.sort()
+        run = tempfile.TemporaryFile(dir=self.temp_dir)
+        block_records = self._block_records()
+        block = []
+        for record in records:
+            block.append(record)
+            if len(block) == block_records:
+                pickle.dump(block, run, pickle.HIGHEST_PROTOCOL)
+                block = []
+        if block:
+            pickle.dump(block, run, pickle.HIGHEST_PROTOCOL)
+        run.seek(0)
+        return run
+    
+    def _block_records(self):
+        """Block size that keeps the blocks of two merges within half the budget"""
+        fitting = self.memory_budget // (4 * self.MERGE_FAN_IN * self.RECORD_OVERHEAD)
+        return max(64, min(self.RUN_BLOCK_RECORDS, fitting))
+    
+    def _read_run(self, run):
+        while True:
+            try:
+                block = pickle.load(run)
+            except EOFError:
+                return
+            yield from block
+    
+    def _merge_runs(self, runs):
+        """One sorted stream of the records of several runs, each read once"""
+        streams = [self._read_run(run) for run in runs]
+        if len(streams) == 1:
+            return streams[0]
+        return merge(*streams)
+    
+    def _mark_matches(self, stream1, stream2, flags1, flags2):
+        """Walk two sorted record streams together, flagging cards whose key is in both"""
+        matched = self.MATCHED
+        groups1 = groupby(stream1, key=itemgetter(0))
+        groups2 = groupby(stream2, key=itemgetter(0))
+        group1 = next(groups1, None)
+        group2 = next(groups2, None)
+        while group1 is not None and group2 is not None:
+            if group1[0] < group2[0]:
+                group1 = next(groups1, None)
+            elif group1[0] > group2[0]:
+                group2 = next(groups2, None)
+            else:
+                for _, card_no in group1[1]:
+                    flags1[card_no] |= matched
+                for _, card_no in group2[1]:
+                    flags2[card_no] |= matched
+                group1 = next(groups1, None)
+                group2 = next(groups2, None)
+    
+    def _copy_cards(self, index, flags, wanted, output_path):
+        """Copy the cards flagged exactly wanted to output_path, returns how many"""
+        count = 0
+        card_count = len(flags)
+        with open(output_path, 'wb') as f:
+            for card_no, (start, end) in enumerate(index.iter_spans()):
+                if card_no >= card_count:
+                    break
+                if flags[card_no] != wanted:
+                    continue
+                card = index.span_bytes(start, end)
+                f.write(card)
+                if not card.endswith((b'\n', b'\r')):
+                    f.write(b'\r\n' if b'\r\n' in card else b'\n')
+                count += 1
+        return count
+
+class SortableTreeWidget(QTreeWidget):
+    """Custom TreeWidget with sorting functionality"""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.sort_column = 0
+        self.sort_order = Qt.SortOrder.AscendingOrder
+        self.original_data = []
         self.current_data = []
         self.data_type = None  # 'single' for single contacts, 'tuple' for contact pairs
         self.setSortingEnabled(False)
@@ -486,188 +2696,879 @@ class SortableTreeWidget(QTreeWidget):
         self.original_data = data.copy()
         self.current_data = data.copy()
         
-        # Determine data type based on first element
-        if data:
-            if hasattr(data[0], 'name'):
-                self.data_type = 'single'
-            else:
-                self.data_type = 'tuple'
-        else:
-            self.data_type = None  # Empty data
-            
-        self.setHeaderLabels(headers)
-        self.display_data()
-
-    def handle_header_click(self, logical_index):
-        """Handle header click for sorting"""
-        # Don't sort if there's no data
-        if not self.current_data:
-            return
-            
-        if logical_index == self.sort_column:
-            self.sort_order = (
-                Qt.SortOrder.DescendingOrder 
-                if self.sort_order == Qt.SortOrder.AscendingOrder 
-                else Qt.SortOrder.AscendingOrder
-            )
-        else:
-            self.sort_column = logical_index
-            self.sort_order = Qt.SortOrder.AscendingOrder
-
-        self.sort_data()
-        self.display_data()
-
-    def sort_data(self):
-        """Sort the data based on the selected column"""
-        # Don't sort if there's no data
-        if not self.current_data:
+        # Determine data type based on first element
+        if data:
+            if hasattr(data[0], 'name'):
+                self.data_type = 'single'
+            else:
+                self.data_type = 'tuple'
+        else:
+            self.data_type = None  # Empty data
+            
+        self.setHeaderLabels(headers)
+        self.display_data()
+
+    def handle_header_click(self, logical_index):
+        """Handle header click for sorting"""
+        # Don't sort if there's no data
+        if not self.current_data:
+            return
+            
+        if logical_index == self.sort_column:
+            self.sort_order = (
+                Qt.SortOrder.DescendingOrder 
+                if self.sort_order == Qt.SortOrder.AscendingOrder 
+                else Qt.SortOrder.AscendingOrder
+            )
+        else:
+            self.sort_column = logical_index
+            self.sort_order = Qt.SortOrder.AscendingOrder
+
+        self.sort_data()
+        self.display_data()
+
+    def sort_data(self):
+        """Sort the data based on the selected column"""
+        # Don't sort if there's no data
+        if not self.current_data:
+            return
+            
+        if self.sort_column == 0:  # Row number column - reset to original order
+            self.current_data = self.original_data.copy()
+        else:
+            # Get the appropriate sort key based on column and data type
+            sort_key = None
+            
+            if self.data_type == 'single':
+                # Single contact data
+                if self.sort_column == 1:  # Name column
+                    sort_key = lambda x: normalize_name(x.name)
+                elif self.sort_column == 2:  # Phone column
+                    sort_key = lambda x: x.phone or ''
+                elif self.sort_column == 3:  # Additional phones column
+                    sort_key = lambda x: len(x.additional_phones.split(', ')) if x.additional_phones else 0
+            elif self.data_type == 'tuple':
+                # Tuple of contacts (common contacts)
+                if self.sort_column == 1:  # First contact name
+                    sort_key = lambda x: normalize_name(x[0].name)
+                elif self.sort_column == 2:  # First contact phone
+                    sort_key = lambda x: x[0].phone or ''
+                elif self.sort_column == 3:  # Second contact name
+                    sort_key = lambda x: normalize_name(x[1].name)
+                elif self.sort_column == 4:  # Second contact phone
+                    sort_key = lambda x: x[1].phone or ''
+            
+            # Apply sorting if we have a valid sort key
+            if sort_key:
+                try:
+                    self.current_data.sort(
+                        key=sort_key, 
+                        reverse=self.sort_order == Qt.SortOrder.DescendingOrder
+                    )
+                except Exception as e:
+                    # If sorting fails, keep the current order
+                    print(f"Sorting error: {e}")
+
+    def display_data(self):
+        """Display the current data in the tree widget"""
+        self.clear()
+        
+        if not self.current_data:
+            # Update header to show no sort indicator when empty
+            self.header().setSortIndicator(-1, self.sort_order)
+            return
+        
+        # Items are added in one call, which is cheaper than one at a time
+        tree_items = []
+        for index, item in enumerate(self.current_data, start=1):
+            if self.data_type == 'single':
+                # Single contact
+                tree_item = QTreeWidgetItem([
+                    str(index),
+                    item.name,
+                    item.phone or 'No Phone',
+                    item.additional_phones or '-'
+                ])
+            elif self.data_type == 'tuple':
+                # Tuple of contacts (common contacts)
+                contact1, contact2 = item
+                tree_item = QTreeWidgetItem([
+                    str(index),
+                    contact1.name,
+                    contact1.phone or 'No Phone',
+                    contact2.name,
+                    contact2.phone or 'No Phone'
+                ])
+            else:
+                continue  # Skip if data type is unknown
+            
+            # Store the original data for export functionality
+            tree_item.setData(0, Qt.ItemDataRole.UserRole, item)
+            tree_items.append(tree_item)
+        self.addTopLevelItems(tree_items)
+        
+        # Update header sort indicator
+        if self.sort_column != 0:
+            self.header().setSortIndicator(self.sort_column, self.sort_order)
+        else:
+            self.header().setSortIndicator(-1, self.sort_order)
+
+    def get_current_data(self):
+        """Get the current sorted data"""
+        return self.current_data
+
+class ComparisonCancelled(Exception):
+    """Raised in a ComparisonThread's job once Cancel was clicked"""
+
+class ComparisonThread(QThread):
+    """Runs a comparison job off the GUI thread.
+
+    The job is called with the thread's stage method, which reports the
+    name and percent of each stage and raises ComparisonCancelled once
+    requestInterruption was called, so a job stops at its next stage. The
+    window receives progress, results and errors as queued signals.
+    """
+    progress = pyqtSignal(str, int)
+    results_ready = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, job, parent=None):
+        super().__init__(parent)
+        self.job = job
+
+    def stage(self, name, percent):
+        if self.isInterruptionRequested():
+            raise ComparisonCancelled()
+        self.progress.emit(name, percent)
+
+    def run(self):
+        try:
+            results = self.job(self.stage)
+        except ComparisonCancelled:
+            return
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        self.results_ready.emit(results)
+
+class ComparisonWindow(QMainWindow):
+    # Matching and the result tables only need these; cards exported to VCF
+    # are read again from the source files by card number. Card hashes let
+    # an edited file be parsed again only where it changed
+    COMPARE_FIELDS = ('name', 'tel', 'photo', 'hash')
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.comparator = VcfComparator()
+        self.parse_cache = VcfParseCache()
+        self.comparison_results = None
+        self.source_stats = {}
+        # (size, mtime) and ContactStore of each compared file, kept between
+        # runs so changing only the options does not read the files again
+        self.loaded_stores = {}
+        # The ContactStores of file 1 and file 2 last compared. A file picked
+        # in their place is parsed as an edited version of them
+        self.compared_stores = (None, None)
+        # The ComparisonThread of the comparison running, if any
+        self.compare_thread = None
+        self.initUI()
+        QApplication.instance().aboutToQuit.connect(self.stop_comparison)
+    
+    def initUI(self):
+        self.setWindowTitle('VCF File Comparison')
+        self.setGeometry(150, 150, 1200, 850)
+        
+        central_widget = QWidget()
+        self.setCentralWidget(central_widget)
+        
+        layout = QVBoxLayout(central_widget)
+        
+        # File selection section
+        file_section = QHBoxLayout()
+        
+        # File 1 selection
+        file1_layout = QVBoxLayout()
+        file1_layout.addWidget(QLabel("File 1:"))
+        self.file1_label = QLabel("No file selected")
+        self.file1_label.setStyleSheet("border: 1px solid gray; padding: 5px;")
+        self.file1_btn = QPushButton("Select File 1")
+        self.file1_btn.clicked.connect(self.select_file1)
+        file1_layout.addWidget(self.file1_label)
+        file1_layout.addWidget(self.file1_btn)
+        
+        # File 2 selection
+        file2_layout = QVBoxLayout()
+        file2_layout.addWidget(QLabel("File 2:"))
+        self.file2_label = QLabel("No file selected")
+        self.file2_label.setStyleSheet("border: 1px solid gray; padding: 5px;")
+        self.file2_btn = QPushButton("Select File 2")
+        self.file2_btn.clicked.connect(self.select_file2)
+        file2_layout.addWidget(self.file2_label)
+        file2_layout.addWidget(self.file2_btn)
+        
+        file_section.addLayout(file1_layout)
+        file_section.addLayout(file2_layout)
+        
+        # Comparison options section
+        options_group = QGroupBox("Comparison Options")
+        options_layout = QVBoxLayout(options_group)
+        
+        # First row: Match method
+        match_layout = QHBoxLayout()
+        match_layout.addWidget(QLabel("Match Method:"))
+        self.match_method_combo = QComboBox()
+        self.match_method_combo.addItems(list(MATCH_METHODS))
+        match_layout.addWidget(self.match_method_combo)
+        match_layout.addStretch()
+        
+        # Second row: Phone filter
+        phone_layout = QHBoxLayout()
+        phone_layout.addWidget(QLabel("Phone Filter:"))
+        self.phone_filter_combo = QComboBox()
+        self.phone_filter_combo.addItems(["All Contacts", "With Phone Only", "Without Phone Only"])
+        self.phone_filter_combo.setToolTip("Choose which contacts to include in the comparison based on phone number presence")
+        phone_layout.addWidget(self.phone_filter_combo)
+        phone_layout.addWidget(QLabel("Country Code: +"))
+        self.country_code_edit = QLineEdit(DEFAULT_COUNTRY_CODE)
+        self.country_code_edit.setMaximumWidth(50)
+        self.country_code_edit.setToolTip("Country of phone numbers written without one (e.g. 0912...)")
+        phone_layout.addWidget(self.country_code_edit)
+        self.suffix_match_check = QCheckBox(f"Match last {PHONE_SUFFIX_DIGITS} digits")
+        self.suffix_match_check.setToolTip("Match phone numbers on the end of their national number, whatever country code they were written with")
+        phone_layout.addWidget(self.suffix_match_check)
+        phone_layout.addStretch()
+        
+        # Third row: Compare button
+        button_layout = QHBoxLayout()
+        self.compare_btn = QPushButton("Compare Files")
+        self.compare_btn.clicked.connect(self.compare_files)
+        self.compare_btn.setEnabled(False)
+        button_layout.addWidget(self.compare_btn)
+        self.cancel_btn = QPushButton("Cancel")
+        self.cancel_btn.clicked.connect(self.cancel_comparison)
+        self.cancel_btn.setVisible(False)
+        button_layout.addWidget(self.cancel_btn)
+        self.external_check = QCheckBox("Compare on disk (files larger than memory)")
+        self.external_check.setToolTip("Sort the files' keys on disk and write the results straight to VCF files in a folder you choose")
+        button_layout.addWidget(self.external_check)
+        self.progress_label = QLabel("")
+        button_layout.addWidget(self.progress_label)
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setVisible(False)
+        button_layout.addWidget(self.progress_bar)
+        button_layout.addStretch()
+        
+        options_layout.addLayout(match_layout)
+        options_layout.addLayout(phone_layout)
+        options_layout.addLayout(button_layout)
+        
+        layout.addLayout(file_section)
+        layout.addWidget(options_group)
+        
+        # Results section
+        self.results_tab = QTabWidget()
+        
+        # Summary tab
+        self.summary_text = QTextEdit()
+        self.summary_text.setReadOnly(True)
+        self.results_tab.addTab(self.summary_text, "Summary")
+        
+        # Only in File 1 tab
+        self.file1_tree = SortableTreeWidget()
+        self.file1_tree.setHeaderLabels(['#', 'Name', 'Phone', 'Additional Phones'])
+        self.results_tab.addTab(self.file1_tree, "Only in File 1")
+        
+        # Only in File 2 tab
+        self.file2_tree = SortableTreeWidget()
+        self.file2_tree.setHeaderLabels(['#', 'Name', 'Phone', 'Additional Phones'])
+        self.results_tab.addTab(self.file2_tree, "Only in File 2")
+        
+        # Common contacts tab
+        self.common_tree = SortableTreeWidget()
+        self.common_tree.setHeaderLabels(['#', 'Name (File 1)', 'Phone (File 1)', 'Name (File 2)', 'Phone (File 2)'])
+        self.results_tab.addTab(self.common_tree, "Common Contacts")
+        
+        layout.addWidget(self.results_tab)
+        
+        # Export buttons
+        export_layout = QHBoxLayout()
+        
+        # VCF Export buttons
+        self.export_file1_btn = QPushButton("Export VCF: Only in File 1")
+        self.export_file1_btn.clicked.connect(lambda: self.export_contacts('file1', 'vcf'))
+        self.export_file1_btn.setEnabled(False)
+        
+        self.export_file2_btn = QPushButton("Export VCF: Only in File 2")
+        self.export_file2_btn.clicked.connect(lambda: self.export_contacts('file2', 'vcf'))
+        self.export_file2_btn.setEnabled(False)
+        
+        self.export_common_btn = QPushButton("Export VCF: Common Contacts")
+        self.export_common_btn.clicked.connect(lambda: self.export_contacts('common', 'vcf'))
+        self.export_common_btn.setEnabled(False)
+        
+        export_layout.addWidget(self.export_file1_btn)
+        export_layout.addWidget(self.export_file2_btn)
+        export_layout.addWidget(self.export_common_btn)
+        
+        # Excel Export buttons
+        excel_layout = QHBoxLayout()
+        
+        self.export_excel_file1_btn = QPushButton("Export Excel: Only in File 1")
+        self.export_excel_file1_btn.clicked.connect(lambda: self.export_contacts('file1', 'excel'))
+        self.export_excel_file1_btn.setEnabled(False)
+        
+        self.export_excel_file2_btn = QPushButton("Export Excel: Only in File 2")
+        self.export_excel_file2_btn.clicked.connect(lambda: self.export_contacts('file2', 'excel'))
+        self.export_excel_file2_btn.setEnabled(False)
+        
+        self.export_excel_common_btn = QPushButton("Export Excel: Common Contacts")
+        self.export_excel_common_btn.clicked.connect(lambda: self.export_contacts('common', 'excel'))
+        self.export_excel_common_btn.setEnabled(False)
+        
+        self.export_excel_all_btn = QPushButton("Export Excel: Complete Comparison")
+        self.export_excel_all_btn.clicked.connect(lambda: self.export_contacts('all', 'excel'))
+        self.export_excel_all_btn.setEnabled(False)
+        
+        excel_layout.addWidget(self.export_excel_file1_btn)
+        excel_layout.addWidget(self.export_excel_file2_btn)
+        excel_layout.addWidget(self.export_excel_common_btn)
+        excel_layout.addWidget(self.export_excel_all_btn)
+        
+        excel_layout.addStretch()
+        export_layout.addStretch()
+        
+        layout.addLayout(export_layout)
+        layout.addLayout(excel_layout)
+        
+        # Show Excel availability status
+        if not EXCEL_AVAILABLE:
+            excel_warning = QLabel("⚠️ Excel export requires 'openpyxl' library. Install with: pip install openpyxl")
+            excel_warning.setStyleSheet("color: orange; font-weight: bold;")
+            layout.addWidget(excel_warning)
+            
+            # Disable Excel buttons
+            self.export_excel_file1_btn.setEnabled(False)
+            self.export_excel_file2_btn.setEnabled(False)
+            self.export_excel_common_btn.setEnabled(False)
+            self.export_excel_all_btn.setEnabled(False)
+    
+    def select_file1(self):
+        file_path, _ = QFileDialog.getOpenFileName(self, "Select VCF File 1", "", "VCF Files (*.vcf)")
+        if file_path:
+            self.comparator.file1_path = file_path
+            self.file1_label.setText(file_path.split('/')[-1])
+            self.check_ready_to_compare()
+    
+    def select_file2(self):
+        file_path, _ = QFileDialog.getOpenFileName(self, "Select VCF File 2", "", "VCF Files (*.vcf)")
+        if file_path:
+            self.comparator.file2_path = file_path
+            self.file2_label.setText(file_path.split('/')[-1])
+            self.check_ready_to_compare()
+    
+    def check_ready_to_compare(self):
+        if self.comparator.file1_path and self.comparator.file2_path:
+            self.compare_btn.setEnabled(True)
+    
+    def compare_files(self):
+        if self.compare_thread is not None:
+            return
+        if self.external_check.isChecked():
+            self.compare_files_on_disk()
+            return
+        try:
+            parser = VcfParser(fields=self.COMPARE_FIELDS)
+            file1_path = self.comparator.file1_path
+            file2_path = self.comparator.file2_path
+            # Kept with the results they were parsed from, see export_to_vcf
+            source_stats = {path: self._file_stat(path) for path in (file1_path, file2_path)}
+            self.loaded_stores = {
+                path: self.loaded_stores[path] for path in source_stats if path in self.loaded_stores
+            }
+            
+            # Options are read here; the thread only sees their values
+            country_code = ''.join(c for c in self.country_code_edit.text() if c.isdigit())
+            self.comparator.country_code = country_code or DEFAULT_COUNTRY_CODE
+            self.comparator.suffix_digits = PHONE_SUFFIX_DIGITS if self.suffix_match_check.isChecked() else None
+            match_method = self.match_method_combo.currentText()
+            phone_filter = self.phone_filter_combo.currentText()
+        except Exception as e:
+            QMessageBox.critical(self, "Comparison Error", f"Error comparing files: {str(e)}")
+            return
+        
+        def job(stage):
+            previous1, previous2 = self.compared_stores
+            stage("Parsing file 1", 0)
+            file1_contacts = self._load_store(file1_path, source_stats[file1_path], parser, previous1,
+                                              lambda done, total: stage("Parsing file 1", 30 * done // max(total, 1)))
+            stage("Parsing file 2", 30)
+            file2_contacts = self._load_store(file2_path, source_stats[file2_path], parser, previous2,
+                                              lambda done, total: stage("Parsing file 2", 30 + 30 * done // max(total, 1)))
+            self.compared_stores = (file1_contacts, file2_contacts)
+            return self.comparator.compare_files(file1_contacts, file2_contacts, match_method, phone_filter, stage)
+        
+        self.start_comparison(job, lambda results: self.show_comparison_results(results, source_stats))
+    
+    def start_comparison(self, job, show_results):
+        """Run job on a ComparisonThread, passing what it returns to show_results"""
+        self.compare_thread = ComparisonThread(job, self)
+        self.compare_thread.progress.connect(self.show_progress)
+        self.compare_thread.results_ready.connect(show_results)
+        self.compare_thread.failed.connect(self.show_comparison_error)
+        self.compare_thread.finished.connect(self.comparison_finished)
+        self.set_comparing(True)
+        self.compare_thread.start()
+    
+    def set_comparing(self, comparing):
+        """Lock the files, options and exports while a comparison runs"""
+        self.compare_btn.setEnabled(not comparing)
+        self.file1_btn.setEnabled(not comparing)
+        self.file2_btn.setEnabled(not comparing)
+        self.cancel_btn.setVisible(comparing)
+        self.cancel_btn.setEnabled(comparing)
+        self.progress_bar.setVisible(comparing)
+        self.set_exports_enabled(not comparing and self.comparison_results is not None)
+        if not comparing:
+            self.progress_label.setText("")
+    
+    def set_exports_enabled(self, enabled):
+        self.export_file1_btn.setEnabled(enabled)
+        self.export_file2_btn.setEnabled(enabled)
+        self.export_common_btn.setEnabled(enabled)
+        enabled = enabled and EXCEL_AVAILABLE
+        self.export_excel_file1_btn.setEnabled(enabled)
+        self.export_excel_file2_btn.setEnabled(enabled)
+        self.export_excel_common_btn.setEnabled(enabled)
+        self.export_excel_all_btn.setEnabled(enabled)
+    
+    def show_progress(self, stage, percent):
+        self.progress_label.setText(f"{stage}...")
+        self.progress_bar.setValue(percent)
+    
+    def cancel_comparison(self):
+        """Stop the running comparison at its next progress report"""
+        if self.compare_thread is not None:
+            self.compare_thread.requestInterruption()
+            self.cancel_btn.setEnabled(False)
+            self.progress_label.setText("Cancelling...")
+    
+    def stop_comparison(self):
+        """Cancel the running comparison and wait for its thread to end"""
+        if self.compare_thread is not None:
+            self.compare_thread.requestInterruption()
+            self.compare_thread.wait()
+    
+    def comparison_finished(self):
+        self.compare_thread.deleteLater()
+        self.compare_thread = None
+        self.set_comparing(False)
+    
+    def show_comparison_error(self, message):
+        QMessageBox.critical(self, "Comparison Error", f"Error comparing files: {message}")
+    
+    def show_comparison_results(self, results, source_stats):
+        # Results that were on their way when Cancel was clicked are dropped
+        if self.compare_thread.isInterruptionRequested():
+            return
+        try:
+            self.comparison_results = results
+            self.source_stats = source_stats
+            
+            # Tables are filled on the GUI thread; paint the stage first;
+            # the exports are enabled once the thread has finished
+            self.show_progress("Rendering results", 90)
+            self.progress_label.repaint()
+            self.progress_bar.repaint()
+            self.display_results()
+            
+        except Exception as e:
+            QMessageBox.critical(self, "Comparison Error", f"Error comparing files: {str(e)}")
+    
+    def compare_files_on_disk(self):
+        """Compare with ExternalVcfComparator on a ComparisonThread, writing the results to VCF files"""
+        output_dir = QFileDialog.getExistingDirectory(self, "Folder for Comparison Results")
+        if not output_dir:
+            return
+        
+        phone_filter = self.phone_filter_combo.currentText()
+        filter_suffix = ""
+        if phone_filter == "With Phone Only":
+            filter_suffix = "_with_phone"
+        elif phone_filter == "Without Phone Only":
+            filter_suffix = "_without_phone"
+        output_paths = {
+            'only_in_file1': os.path.join(output_dir, f"only_in_file1{filter_suffix}.vcf"),
+            'only_in_file2': os.path.join(output_dir, f"only_in_file2{filter_suffix}.vcf"),
+            'common': os.path.join(output_dir, f"common_contacts{filter_suffix}.vcf")
+        }
+        
+        comparator = ExternalVcfComparator()
+        country_code = ''.join(c for c in self.country_code_edit.text() if c.isdigit())
+        comparator.country_code = country_code or DEFAULT_COUNTRY_CODE
+        comparator.suffix_digits = PHONE_SUFFIX_DIGITS if self.suffix_match_check.isChecked() else None
+        match_method = self.match_method_combo.currentText()
+        file1_path = self.comparator.file1_path
+        file2_path = self.comparator.file2_path
+        
+        def job(stage):
+            return comparator.compare_paths(file1_path, file2_path, output_paths, match_method, phone_filter, stage)
+        
+        self.start_comparison(job, lambda counts: self.show_disk_results(counts, output_paths))
+    
+    def show_disk_results(self, counts, output_paths):
+        """Summarize a comparison on disk; nothing is held in memory to show or export"""
+        if self.compare_thread.isInterruptionRequested():
+            return
+        self.comparison_results = None
+        for tree in (self.file1_tree, self.file2_tree, self.common_tree):
+            tree.clear()
+            tree.original_data = []
+            tree.current_data = []
+        
+        self.summary_text.setPlainText(f"""
+Comparison Results (on disk)
+============================
+
+File 1: {self.comparator.file1_path.split('/')[-1]}
+Total contacts: {counts['file1_total']}
+Filtered contacts: {counts['file1_filtered']}
+
+File 2: {self.comparator.file2_path.split('/')[-1]}
+Total contacts: {counts['file2_total']}
+Filtered contacts: {counts['file2_filtered']}
+
+Match Method: {counts['match_method']}
+Phone Filter: {counts['phone_filter']}
+
+Results:
+--------
+Contacts only in File 1: {counts['only_in_file1']}  ->  {output_paths['only_in_file1']}
+Contacts only in File 2: {counts['only_in_file2']}  ->  {output_paths['only_in_file2']}
+Common contacts: {counts['common']}  ->  {output_paths['common']}
+        """)
+        self.results_tab.setTabText(1, f"Only in File 1 ({counts['only_in_file1']})")
+        self.results_tab.setTabText(2, f"Only in File 2 ({counts['only_in_file2']})")
+        self.results_tab.setTabText(3, f"Common Contacts ({counts['common']})")
+        self.results_tab.setCurrentIndex(0)
+    
+    def _load_store(self, file_path, stat, parser, previous=None, progress=None):
+        """The ContactStore of a file, parsed again only if its size or mtime changed.
+
+        stat is the file's _file_stat. A changed file is parsed as an edit
+        of its last ContactStore, or else of previous, the store last
+        compared in its place. progress is passed to VcfParseCache.parse.
+        """
+        loaded = self.loaded_stores.get(file_path)
+        if loaded is None or loaded[0] != stat:
+            if loaded is not None:
+                previous = loaded[1]
+            loaded = (stat, self.parse_cache.parse(file_path, parser, previous, progress))
+            self.loaded_stores[file_path] = loaded
+        return loaded[1]
+
+    def _file_stat(self, file_path):
+        stat = os.stat(file_path)
+        return (stat.st_size, stat.st_mtime_ns)
+
+    def display_results(self):
+        if not self.comparison_results:
+            return
+        
+        results = self.comparison_results
+        
+        # Generate filter description
+        phone_filter_desc = ""
+        if results['phone_filter'] == "With Phone Only":
+            phone_filter_desc = " (contacts with phone numbers only)"
+        elif results['phone_filter'] == "Without Phone Only":
+            phone_filter_desc = " (contacts without phone numbers only)"
+        elif results['phone_filter'] == "All Contacts":
+            phone_filter_desc = " (all contacts)"
+        
+        # Update summary
+        summary = f"""
+Comparison Results
+==================
+
+File 1: {self.comparator.file1_path.split('/')[-1]}
+Total contacts: {results['file1_total']}
+Filtered contacts: {results['file1_filtered']}{phone_filter_desc}
+
+File 2: {self.comparator.file2_path.split('/')[-1]}
+Total contacts: {results['file2_total']}
+Filtered contacts: {results['file2_filtered']}{phone_filter_desc}
+
+Match Method: {results['match_method']}
+Phone Filter: {results['phone_filter']}
+
+Results{phone_filter_desc}:
+--------
+Contacts only in File 1: {len(results['only_in_file1'])}
+Contacts only in File 2: {len(results['only_in_file2'])}
+Common contacts: {len(results['common'])}
+
+Analysis:
+---------
+File 1 has {len(results['only_in_file1'])} unique contacts not found in File 2
+File 2 has {len(results['only_in_file2'])} unique contacts not found in File 1
+{len(results['common'])} contacts are present in both files
+
+Filter Statistics:
+------------------
+File 1: {results['file1_total'] - results['file1_filtered']} contacts excluded by phone filter
+File 2: {results['file2_total'] - results['file2_filtered']} contacts excluded by phone filter
+
+Export Options:
+---------------
+• VCF Export: Maintains original contact format, compatible with phone/email apps
+• Excel Export: Creates structured spreadsheet with enhanced formatting and metadata
+• Complete Comparison Excel: All results in one file with multiple sheets
+
+Sorting Instructions:
+--------------------
+- Click any column header to sort by that column
+- Click the same header again to reverse the sort order
+- Click the # column to restore original order
+- All tables support sorting by Name and Phone number
+
+VCF Format Support:
+-------------------
+- VCF 2.1 and 3.0 formats supported
+- Handles both N (structured name) and FN (full name) fields
+- Supports UTF-8 and Quoted-Printable encoding
+- Fallback from N field to FN field for name extraction
+        """
+        
+        self.summary_text.setPlainText(summary)
+        
+        # Update trees with sortable data
+        self.file1_tree.set_data(results['only_in_file1'], ['#', 'Name', 'Phone', 'Additional Phones'])
+        self.file2_tree.set_data(results['only_in_file2'], ['#', 'Name', 'Phone', 'Additional Phones'])
+        self.common_tree.set_data(results['common'], ['#', 'Name (File 1)', 'Phone (File 1)', 'Name (File 2)', 'Phone (File 2)'])
+        
+        # Update tab titles with counts and filter info
+        filter_suffix = ""
+        if results['phone_filter'] != "All Contacts":
+            if results['phone_filter'] == "With Phone Only":
+                filter_suffix = " (📞)"
+            elif results['phone_filter'] == "Without Phone Only":
+                filter_suffix = " (📵)"
+        
+        self.results_tab.setTabText(1, f"Only in File 1 ({len(results['only_in_file1'])}){filter_suffix}")
+        self.results_tab.setTabText(2, f"Only in File 2 ({len(results['only_in_file2'])}){filter_suffix}")
+        self.results_tab.setTabText(3, f"Common Contacts ({len(results['common'])}){filter_suffix}")
+    
+    def export_contacts(self, contact_type, export_format):
+        if not self.comparison_results:
+            return
+        
+        if export_format == 'excel':
+            self.export_to_excel(contact_type)
+        else:
+            self.export_to_vcf(contact_type)
+    
+    def export_to_excel(self, contact_type):
+        """Export contacts to Excel format"""
+        if not EXCEL_AVAILABLE:
+            QMessageBox.critical(self, "Excel Export Error", 
+                               "Excel export requires 'openpyxl' library.\n"
+                               "Install it with: pip install openpyxl")
+            return
+        
+        if contact_type == 'all':
+            # Export complete comparison to Excel
+            file_path, _ = QFileDialog.getSaveFileName(
+                self, "Export Complete Comparison to Excel", 
+                "vcf_comparison_complete.xlsx", 
+                "Excel Files (*.xlsx)"
+            )
+            if not file_path:
+                return
+            
+            try:
+                ExcelExporter.export_comparison_to_excel(
+                    self.comparison_results, 
+                    file_path, 
+                    self.comparison_results['match_method'], 
+                    self.comparison_results['phone_filter']
+                )
+                QMessageBox.information(self, "Export Success", 
+                                      f"Complete comparison exported to {file_path}")
+            except Exception as e:
+                QMessageBox.critical(self, "Export Error", f"Error exporting to Excel: {str(e)}")
+            return
+        
+        # Single category export
+        contacts_to_export = []
+        default_filename = ""
+        
+        # Add filter suffix to filename
+        filter_suffix = ""
+        if self.comparison_results['phone_filter'] == "With Phone Only":
+            filter_suffix = "_with_phone"
+        elif self.comparison_results['phone_filter'] == "Without Phone Only":
+            filter_suffix = "_without_phone"
+        
+        if contact_type == 'file1':
+            current_data = self.file1_tree.get_current_data()
+            contacts_to_export = current_data
+            default_filename = f"only_in_file1{filter_suffix}.xlsx"
+        elif contact_type == 'file2':
+            current_data = self.file2_tree.get_current_data()
+            contacts_to_export = current_data
+            default_filename = f"only_in_file2{filter_suffix}.xlsx"
+        elif contact_type == 'common':
+            current_data = self.common_tree.get_current_data()
+            contacts_to_export = [pair[0] for pair in current_data]
+            default_filename = f"common_contacts{filter_suffix}.xlsx"
+        
+        if not contacts_to_export:
+            QMessageBox.information(self, "Export", "No contacts to export.")
+            return
+        
+        file_path, _ = QFileDialog.getSaveFileName(self, "Export Contacts to Excel", default_filename, "Excel Files (*.xlsx)")
+        if not file_path:
+            return
+        
+        try:
+            ExcelExporter.export_contacts_to_excel(contacts_to_export, file_path)
+            filter_msg = f" (filtered: {self.comparison_results['phone_filter']})" if self.comparison_results['phone_filter'] != "All Contacts" else ""
+            QMessageBox.information(self, "Export Success", f"Exported {len(contacts_to_export)} contacts to {file_path}{filter_msg}")
+        except Exception as e:
+            QMessageBox.critical(self, "Export Error", f"Error exporting to Excel: {str(e)}")
+    
+    def export_to_vcf(self, contact_type):
+        """Export contacts to VCF format"""
+        contacts_to_export = []
+        default_filename = ""
+        
+        # Add filter suffix to filename
+        filter_suffix = ""
+        if self.comparison_results['phone_filter'] == "With Phone Only":
+            filter_suffix = "_with_phone"
+        elif self.comparison_results['phone_filter'] == "Without Phone Only":
+            filter_suffix = "_without_phone"
+        
+        if contact_type == 'file1':
+            # Get current sorted data from the tree widget
+            current_data = self.file1_tree.get_current_data()
+            contacts_to_export = current_data
+            default_filename = f"only_in_file1{filter_suffix}.vcf"
+        elif contact_type == 'file2':
+            # Get current sorted data from the tree widget
+            current_data = self.file2_tree.get_current_data()
+            contacts_to_export = current_data
+            default_filename = f"only_in_file2{filter_suffix}.vcf"
+        elif contact_type == 'common':
+            # For common contacts, export from file1 (first contact in each pair)
+            current_data = self.common_tree.get_current_data()
+            contacts_to_export = [pair[0] for pair in current_data]
+            default_filename = f"common_contacts{filter_suffix}.vcf"
+        
+        if not contacts_to_export:
+            QMessageBox.information(self, "Export", "No contacts to export.")
             return
-            
-        if self.sort_column == 0:  # Row number column - reset to original order
-            self.current_data = self.original_data.copy()
-        else:
-            # Get the appropriate sort key based on column and data type
-            sort_key = None
-            
-            if self.data_type == 'single':
-                # Single contact data
-                if self.sort_column == 1:  # Name column
-                    sort_key = lambda x: x.name.lower()
-                elif self.sort_column == 2:  # Phone column
-                    sort_key = lambda x: x.phone or ''
-                elif self.sort_column == 3:  # Additional phones column
-                    sort_key = lambda x: len(x.additional_phones.split(', ')) if x.additional_phones else 0
-            elif self.data_type == 'tuple':
-                # Tuple of contacts (common contacts)
-                if self.sort_column == 1:  # First contact name
-                    sort_key = lambda x: x[0].name.lower()
-                elif self.sort_column == 2:  # First contact phone
-                    sort_key = lambda x: x[0].phone or ''
-                elif self.sort_column == 3:  # Second contact name
-                    sort_key = lambda x: x[1].name.lower()
-                elif self.sort_column == 4:  # Second contact phone
-                    sort_key = lambda x: x[1].phone or ''
-            
-            # Apply sorting if we have a valid sort key
-            if sort_key:
-                try:
-                    self.current_data.sort(
-                        key=sort_key, 
-                        reverse=self.sort_order == Qt.SortOrder.DescendingOrder
-                    )
-                except Exception as e:
-                    # If sorting fails, keep the current order
-                    print(f"Sorting error: {e}")
-
-    def display_data(self):
-        """Display the current data in the tree widget"""
-        self.clear()
         
-        if not self.current_data:
-            # Update header to show no sort indicator when empty
-            self.header().setSortIndicator(-1, self.sort_order)
+        file_path, _ = QFileDialog.getSaveFileName(self, "Export Contacts", default_filename, "VCF Files (*.vcf)")
+        if not file_path:
             return
         
-        for index, item in enumerate(self.current_data, start=1):
-            if self.data_type == 'single':
-                # Single contact
-                tree_item = QTreeWidgetItem([
-                    str(index),
-                    item.name,
-                    item.phone or 'No Phone',
-                    item.additional_phones or '-'
-                ])
-            elif self.data_type == 'tuple':
-                # Tuple of contacts (common contacts)
-                contact1, contact2 = item
-                tree_item = QTreeWidgetItem([
-                    str(index),
-                    contact1.name,
-                    contact1.phone or 'No Phone',
-                    contact2.name,
-                    contact2.phone or 'No Phone'
-                ])
-            else:
-                continue  # Skip if data type is unknown
+        # Only-in-file-2 contacts come from file 2, everything else from file 1
+        source_path = self.comparator.file2_path if contact_type == 'file2' else self.comparator.file1_path
+        card_index = None
+        try:
+            if self._file_stat(source_path) != self.source_stats.get(source_path):
+                raise ValueError(f"{source_path} changed since the comparison, please compare again")
+            card_index = VcfCardIndex(source_path)
+
+            newline = os.linesep.encode()
+            with open(file_path, 'wb') as f:
+                for contact in contacts_to_export:
+                    write_card(f, card_index.card_lines(contact.card_no), newline)
             
-            # Store the original data for export functionality
-            tree_item.setData(0, Qt.ItemDataRole.UserRole, item)
-            self.addTopLevelItem(tree_item)
-        
-        # Update header sort indicator
-        if self.sort_column != 0:
-            self.header().setSortIndicator(self.sort_column, self.sort_order)
-        else:
-            self.header().setSortIndicator(-1, self.sort_order)
+            filter_msg = f" (filtered: {self.comparison_results['phone_filter']})" if self.comparison_results['phone_filter'] != "All Contacts" else ""
+            QMessageBox.information(self, "Export Success", f"Exported {len(contacts_to_export)} contacts to {file_path}{filter_msg}")
+        except Exception as e:
+            QMessageBox.critical(self, "Export Error", f"Error exporting contacts: {str(e)}")
+        finally:
+            if card_index:
+                card_index.close()
 
-    def get_current_data(self):
-        """Get the current sorted data"""
-        return self.current_data
+class MultiComparisonWindow(QMainWindow):
+    """Compares any number of VCF files at once, e.g. backups of several devices"""
+    # As ComparisonWindow's, less the card hashes: stores are always parsed
+    # whole here, never as edits of earlier ones
+    COMPARE_FIELDS = ('name', 'tel', 'photo')
 
-class ComparisonWindow(QMainWindow):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.comparator = VcfComparator()
+        self.parse_cache = VcfParseCache()
+        self.file_paths = []
+        # The files of the last comparison, in the order of its file indexes
+        self.compared_paths = []
         self.comparison_results = None
+        self.source_stats = {}
         self.initUI()
     
     def initUI(self):
-        self.setWindowTitle('VCF File Comparison')
-        self.setGeometry(150, 150, 1200, 850)
+        self.setWindowTitle('VCF Multi-File Comparison')
+        self.setGeometry(170, 170, 1200, 850)
         
         central_widget = QWidget()
         self.setCentralWidget(central_widget)
         
         layout = QVBoxLayout(central_widget)
         
-        # File selection section
-        file_section = QHBoxLayout()
-        
-        # File 1 selection
-        file1_layout = QVBoxLayout()
-        file1_layout.addWidget(QLabel("File 1:"))
-        self.file1_label = QLabel("No file selected")
-        self.file1_label.setStyleSheet("border: 1px solid gray; padding: 5px;")
-        self.file1_btn = QPushButton("Select File 1")
-        self.file1_btn.clicked.connect(self.select_file1)
-        file1_layout.addWidget(self.file1_label)
-        file1_layout.addWidget(self.file1_btn)
-        
-        # File 2 selection
-        file2_layout = QVBoxLayout()
-        file2_layout.addWidget(QLabel("File 2:"))
-        self.file2_label = QLabel("No file selected")
-        self.file2_label.setStyleSheet("border: 1px solid gray; padding: 5px;")
-        self.file2_btn = QPushButton("Select File 2")
-        self.file2_btn.clicked.connect(self.select_file2)
-        file2_layout.addWidget(self.file2_label)
-        file2_layout.addWidget(self.file2_btn)
+        # File list section
+        files_group = QGroupBox("Files")
+        files_layout = QHBoxLayout(files_group)
+        self.file_list = QListWidget()
+        self.file_list.setSelectionMode(QListWidget.SelectionMode.ExtendedSelection)
+        self.file_list.setMaximumHeight(150)
+        files_layout.addWidget(self.file_list)
         
-        file_section.addLayout(file1_layout)
-        file_section.addLayout(file2_layout)
+        file_buttons = QVBoxLayout()
+        self.add_files_btn = QPushButton("Add Files")
+        self.add_files_btn.clicked.connect(self.add_files)
+        self.remove_files_btn = QPushButton("Remove Selected")
+        self.remove_files_btn.clicked.connect(self.remove_selected_files)
+        self.clear_files_btn = QPushButton("Clear")
+        self.clear_files_btn.clicked.connect(self.clear_files)
+        file_buttons.addWidget(self.add_files_btn)
+        file_buttons.addWidget(self.remove_files_btn)
+        file_buttons.addWidget(self.clear_files_btn)
+        file_buttons.addStretch()
+        files_layout.addLayout(file_buttons)
         
         # Comparison options section
         options_group = QGroupBox("Comparison Options")
         options_layout = QVBoxLayout(options_group)
         
-        # First row: Match method
         match_layout = QHBoxLayout()
         match_layout.addWidget(QLabel("Match Method:"))
         self.match_method_combo = QComboBox()
-        self.match_method_combo.addItems(["Name + Phone", "Name Only", "Phone Only"])
+        self.match_method_combo.addItems(list(MATCH_METHODS))
         match_layout.addWidget(self.match_method_combo)
         match_layout.addStretch()
         
-        # Second row: Phone filter
         phone_layout = QHBoxLayout()
         phone_layout.addWidget(QLabel("Phone Filter:"))
         self.phone_filter_combo = QComboBox()
         self.phone_filter_combo.addItems(["All Contacts", "With Phone Only", "Without Phone Only"])
         self.phone_filter_combo.setToolTip("Choose which contacts to include in the comparison based on phone number presence")
         phone_layout.addWidget(self.phone_filter_combo)
+        phone_layout.addWidget(QLabel("Country Code: +"))
+        self.country_code_edit = QLineEdit(DEFAULT_COUNTRY_CODE)
+        self.country_code_edit.setMaximumWidth(50)
+        self.country_code_edit.setToolTip("Country of phone numbers written without one (e.g. 0912...)")
+        phone_layout.addWidget(self.country_code_edit)
+        self.suffix_match_check = QCheckBox(f"Match last {PHONE_SUFFIX_DIGITS} digits")
+        self.suffix_match_check.setToolTip("Match phone numbers on the end of their national number, whatever country code they were written with")
+        phone_layout.addWidget(self.suffix_match_check)
         phone_layout.addStretch()
         
-        # Third row: Compare button
         button_layout = QHBoxLayout()
         self.compare_btn = QPushButton("Compare Files")
         self.compare_btn.clicked.connect(self.compare_files)
@@ -679,249 +3580,250 @@ class ComparisonWindow(QMainWindow):
         options_layout.addLayout(phone_layout)
         options_layout.addLayout(button_layout)
         
-        layout.addLayout(file_section)
+        layout.addWidget(files_group)
         layout.addWidget(options_group)
         
         # Results section
         self.results_tab = QTabWidget()
         
-        # Summary tab
         self.summary_text = QTextEdit()
         self.summary_text.setReadOnly(True)
         self.results_tab.addTab(self.summary_text, "Summary")
         
-        # Only in File 1 tab
-        self.file1_tree = SortableTreeWidget()
-        self.file1_tree.setHeaderLabels(['#', 'Name', 'Phone', 'Additional Phones'])
-        self.results_tab.addTab(self.file1_tree, "Only in File 1")
+        self.all_files_tree = SortableTreeWidget()
+        self.all_files_tree.setHeaderLabels(['#', 'Name', 'Phone', 'Additional Phones'])
+        self.results_tab.addTab(self.all_files_tree, "In All Files")
         
-        # Only in File 2 tab
-        self.file2_tree = SortableTreeWidget()
-        self.file2_tree.setHeaderLabels(['#', 'Name', 'Phone', 'Additional Phones'])
-        self.results_tab.addTab(self.file2_tree, "Only in File 2")
+        self.one_file_tree = QTreeWidget()
+        self.one_file_tree.setHeaderLabels(['#', 'Name', 'Phone', 'File'])
+        self.results_tab.addTab(self.one_file_tree, "In One File Only")
         
-        # Common contacts tab
-        self.common_tree = SortableTreeWidget()
-        self.common_tree.setHeaderLabels(['#', 'Name (File 1)', 'Phone (File 1)', 'Name (File 2)', 'Phone (File 2)'])
-        self.results_tab.addTab(self.common_tree, "Common Contacts")
+        # Every contact with the files it is in, optionally only one set of files
+        presence_widget = QWidget()
+        presence_layout = QVBoxLayout(presence_widget)
+        subset_layout = QHBoxLayout()
+        subset_layout.addWidget(QLabel("Show:"))
+        self.subset_combo = QComboBox()
+        self.subset_combo.currentIndexChanged.connect(self.display_presence)
+        subset_layout.addWidget(self.subset_combo)
+        subset_layout.addStretch()
+        self.presence_tree = QTreeWidget()
+        self.presence_tree.setHeaderLabels(['#', 'Name', 'Phone', 'Files'])
+        presence_layout.addLayout(subset_layout)
+        presence_layout.addWidget(self.presence_tree)
+        self.results_tab.addTab(presence_widget, "Presence")
         
         layout.addWidget(self.results_tab)
         
-        # Export buttons
+        # Export buttons, one of each format per result category
         export_layout = QHBoxLayout()
-        
-        # VCF Export buttons
-        self.export_file1_btn = QPushButton("Export VCF: Only in File 1")
-        self.export_file1_btn.clicked.connect(lambda: self.export_contacts('file1', 'vcf'))
-        self.export_file1_btn.setEnabled(False)
-        
-        self.export_file2_btn = QPushButton("Export VCF: Only in File 2")
-        self.export_file2_btn.clicked.connect(lambda: self.export_contacts('file2', 'vcf'))
-        self.export_file2_btn.setEnabled(False)
-        
-        self.export_common_btn = QPushButton("Export VCF: Common Contacts")
-        self.export_common_btn.clicked.connect(lambda: self.export_contacts('common', 'vcf'))
-        self.export_common_btn.setEnabled(False)
-        
-        export_layout.addWidget(self.export_file1_btn)
-        export_layout.addWidget(self.export_file2_btn)
-        export_layout.addWidget(self.export_common_btn)
-        
-        # Excel Export buttons
         excel_layout = QHBoxLayout()
+        self.vcf_export_buttons = []
+        self.excel_export_buttons = []
+        for category, title in (('all_files', "In All Files"), ('one_file', "In One File Only"), ('shown', "Shown in Presence")):
+            vcf_btn = QPushButton(f"Export VCF: {title}")
+            vcf_btn.clicked.connect(lambda checked, category=category: self.export_contacts(category, 'vcf'))
+            excel_btn = QPushButton(f"Export Excel: {title}")
+            excel_btn.clicked.connect(lambda checked, category=category: self.export_contacts(category, 'excel'))
+            export_layout.addWidget(vcf_btn)
+            excel_layout.addWidget(excel_btn)
+            self.vcf_export_buttons.append(vcf_btn)
+            self.excel_export_buttons.append(excel_btn)
+        excel_all_btn = QPushButton("Export Excel: Complete Comparison")
+        excel_all_btn.clicked.connect(lambda: self.export_contacts('complete', 'excel'))
+        excel_layout.addWidget(excel_all_btn)
+        self.excel_export_buttons.append(excel_all_btn)
+        for button in self.vcf_export_buttons + self.excel_export_buttons:
+            button.setEnabled(False)
         
-        self.export_excel_file1_btn = QPushButton("Export Excel: Only in File 1")
-        self.export_excel_file1_btn.clicked.connect(lambda: self.export_contacts('file1', 'excel'))
-        self.export_excel_file1_btn.setEnabled(False)
-        
-        self.export_excel_file2_btn = QPushButton("Export Excel: Only in File 2")
-        self.export_excel_file2_btn.clicked.connect(lambda: self.export_contacts('file2', 'excel'))
-        self.export_excel_file2_btn.setEnabled(False)
-        
-        self.export_excel_common_btn = QPushButton("Export Excel: Common Contacts")
-        self.export_excel_common_btn.clicked.connect(lambda: self.export_contacts('common', 'excel'))
-        self.export_excel_common_btn.setEnabled(False)
-        
-        self.export_excel_all_btn = QPushButton("Export Excel: Complete Comparison")
-        self.export_excel_all_btn.clicked.connect(lambda: self.export_contacts('all', 'excel'))
-        self.export_excel_all_btn.setEnabled(False)
-        
-        excel_layout.addWidget(self.export_excel_file1_btn)
-        excel_layout.addWidget(self.export_excel_file2_btn)
-        excel_layout.addWidget(self.export_excel_common_btn)
-        excel_layout.addWidget(self.export_excel_all_btn)
-        
-        excel_layout.addStretch()
         export_layout.addStretch()
-        
+        excel_layout.addStretch()
         layout.addLayout(export_layout)
         layout.addLayout(excel_layout)
         
-        # Show Excel availability status
         if not EXCEL_AVAILABLE:
             excel_warning = QLabel("⚠️ Excel export requires 'openpyxl' library. Install with: pip install openpyxl")
             excel_warning.setStyleSheet("color: orange; font-weight: bold;")
             layout.addWidget(excel_warning)
-            
-            # Disable Excel buttons
-            self.export_excel_file1_btn.setEnabled(False)
-            self.export_excel_file2_btn.setEnabled(False)
-            self.export_excel_common_btn.setEnabled(False)
-            self.export_excel_all_btn.setEnabled(False)
     
-    def select_file1(self):
-        file_path, _ = QFileDialog.getOpenFileName(self, "Select VCF File 1", "", "VCF Files (*.vcf)")
-        if file_path:
-            self.comparator.file1_path = file_path
-            self.file1_label.setText(file_path.split('/')[-1])
-            self.check_ready_to_compare()
+    def add_files(self):
+        file_paths, _ = QFileDialog.getOpenFileNames(self, "Select VCF Files", "", "VCF Files (*.vcf)")
+        for file_path in file_paths:
+            if file_path not in self.file_paths:
+                self.file_paths.append(file_path)
+                item = QListWidgetItem(os.path.basename(file_path))
+                item.setToolTip(file_path)
+                self.file_list.addItem(item)
+        self.check_ready_to_compare()
     
-    def select_file2(self):
-        file_path, _ = QFileDialog.getOpenFileName(self, "Select VCF File 2", "", "VCF Files (*.vcf)")
-        if file_path:
-            self.comparator.file2_path = file_path
-            self.file2_label.setText(file_path.split('/')[-1])
-            self.check_ready_to_compare()
+    def remove_selected_files(self):
+        rows = sorted((self.file_list.row(item) for item in self.file_list.selectedItems()), reverse=True)
+        for row in rows:
+            self.file_list.takeItem(row)
+            del self.file_paths[row]
+        self.check_ready_to_compare()
+    
+    def clear_files(self):
+        self.file_list.clear()
+        self.file_paths = []
+        self.check_ready_to_compare()
     
     def check_ready_to_compare(self):
-        if self.comparator.file1_path and self.comparator.file2_path:
-            self.compare_btn.setEnabled(True)
+        self.compare_btn.setEnabled(len(self.file_paths) >= 2)
     
     def compare_files(self):
         try:
-            # Parse file 1
-            with open(self.comparator.file1_path, 'r', encoding='utf-8') as f:
-                content1 = f.read()
-            parser = VcfParser()
-            file1_contacts = parser.parse_vcf(content1)
+            parser = VcfParser(fields=self.COMPARE_FIELDS)
+            file_paths = list(self.file_paths)
+            self.source_stats = {path: self._file_stat(path) for path in file_paths}
+            stores = [self.parse_cache.parse(path, parser) for path in file_paths]
             
-            # Parse file 2
-            with open(self.comparator.file2_path, 'r', encoding='utf-8') as f:
-                content2 = f.read()
-            file2_contacts = parser.parse_vcf(content2)
-            
-            # Compare files
-            match_method = self.match_method_combo.currentText()
-            phone_filter = self.phone_filter_combo.currentText()
-            self.comparison_results = self.comparator.compare_files(
-                file1_contacts, file2_contacts, match_method, phone_filter
+            country_code = ''.join(c for c in self.country_code_edit.text() if c.isdigit())
+            self.comparator.country_code = country_code or DEFAULT_COUNTRY_CODE
+            self.comparator.suffix_digits = PHONE_SUFFIX_DIGITS if self.suffix_match_check.isChecked() else None
+            self.comparison_results = self.comparator.compare_many(
+                stores, self.match_method_combo.currentText(), self.phone_filter_combo.currentText()
             )
+            self.compared_paths = file_paths
             
-            # Display results
             self.display_results()
             
-            # Enable export buttons
-            self.export_file1_btn.setEnabled(True)
-            self.export_file2_btn.setEnabled(True)
-            self.export_common_btn.setEnabled(True)
-            
+            for button in self.vcf_export_buttons:
+                button.setEnabled(True)
             if EXCEL_AVAILABLE:
-                self.export_excel_file1_btn.setEnabled(True)
-                self.export_excel_file2_btn.setEnabled(True)
-                self.export_excel_common_btn.setEnabled(True)
-                self.export_excel_all_btn.setEnabled(True)
+                for button in self.excel_export_buttons:
+                    button.setEnabled(True)
             
         except Exception as e:
             QMessageBox.critical(self, "Comparison Error", f"Error comparing files: {str(e)}")
     
+    _file_stat = ComparisonWindow._file_stat
+    
+    def file_names(self):
+        """Numbered names of the compared files, as the results show them"""
+        return [f"{index}. {os.path.basename(path)}" for index, path in enumerate(self.compared_paths, 1)]
+    
     def display_results(self):
         if not self.comparison_results:
             return
         
         results = self.comparison_results
-        
-        # Generate filter description
-        phone_filter_desc = ""
-        if results['phone_filter'] == "With Phone Only":
-            phone_filter_desc = " (contacts with phone numbers only)"
-        elif results['phone_filter'] == "Without Phone Only":
-            phone_filter_desc = " (contacts without phone numbers only)"
-        elif results['phone_filter'] == "All Contacts":
-            phone_filter_desc = " (all contacts)"
-        
-        # Update summary
-        summary = f"""
-Comparison Results
-==================
-
-File 1: {self.comparator.file1_path.split('/')[-1]}
-Total contacts: {results['file1_total']}
-Filtered contacts: {results['file1_filtered']}{phone_filter_desc}
+        file_names = self.file_names()
+        
+        # How many contacts each set of files shares, most common first
+        subset_counts = {}
+        for files in results['file_sets']:
+            subset_counts[files] = subset_counts.get(files, 0) + 1
+        subsets = sorted(subset_counts.items(), key=lambda item: -item[1])
+        
+        file_lines = '\n'.join(
+            f"{name}: {total} contacts, {filtered} compared"
+            for name, total, filtered in zip(file_names, results['file_totals'], results['file_filtered'])
+        )
+        subset_lines = '\n'.join(
+            f"{size:>8}  {' + '.join(file_names[file_index] for file_index in files)}"
+            for files, size in subsets
+        )
+        summary = f"""
+Multi-File Comparison Results
+=============================
 
-File 2: {self.comparator.file2_path.split('/')[-1]}
-Total contacts: {results['file2_total']}
-Filtered contacts: {results['file2_filtered']}{phone_filter_desc}
+Files:
+------
+{file_lines}
 
-Match Method: {self.match_method_combo.currentText()}
+Match Method: {results['match_method']}
 Phone Filter: {results['phone_filter']}
 
-Results{phone_filter_desc}:
+Results:
 --------
-Contacts only in File 1: {len(results['only_in_file1'])}
-Contacts only in File 2: {len(results['only_in_file2'])}
-Common contacts: {len(results['common'])}
-
-Analysis:
----------
-File 1 has {len(results['only_in_file1'])} unique contacts not found in File 2
-File 2 has {len(results['only_in_file2'])} unique contacts not found in File 1
-{len(results['common'])} contacts are present in both files
+Distinct contacts: {len(results['groups'])}
+In all {len(file_names)} files: {len(results['in_all_files'])}
+In one file only: {len(results['in_one_file'])}
 
-Filter Statistics:
-------------------
-File 1: {results['file1_total'] - results['file1_filtered']} contacts excluded by phone filter
-File 2: {results['file2_total'] - results['file2_filtered']} contacts excluded by phone filter
+Contacts per set of files:
+--------------------------
+{subset_lines}
 
 Export Options:
 ---------------
-• VCF Export: Maintains original contact format, compatible with phone/email apps
-• Excel Export: Creates structured spreadsheet with enhanced formatting and metadata
-• Complete Comparison Excel: All results in one file with multiple sheets
-
-Sorting Instructions:
---------------------
-- Click any column header to sort by that column
-- Click the same header again to reverse the sort order
-- Click the # column to restore original order
-- All tables support sorting by Name and Phone number
-
-VCF Format Support:
--------------------
-- VCF 2.1 and 3.0 formats supported
-- Handles both N (structured name) and FN (full name) fields
-- Supports UTF-8 and Quoted-Printable encoding
-- Fallback from N field to FN field for name extraction
+• Each exported contact is taken from the first file it was found in
+• Presence: choose a set of files under "Show" to export only the contacts in exactly those files
         """
-        
         self.summary_text.setPlainText(summary)
         
-        # Update trees with sortable data
-        self.file1_tree.set_data(results['only_in_file1'], ['#', 'Name', 'Phone', 'Additional Phones'])
-        self.file2_tree.set_data(results['only_in_file2'], ['#', 'Name', 'Phone', 'Additional Phones'])
-        self.common_tree.set_data(results['common'], ['#', 'Name (File 1)', 'Phone (File 1)', 'Name (File 2)', 'Phone (File 2)'])
+        self.all_files_tree.set_data([group[0][1] for group in results['in_all_files']], ['#', 'Name', 'Phone', 'Additional Phones'])
         
-        # Update tab titles with counts and filter info
-        filter_suffix = ""
-        if results['phone_filter'] != "All Contacts":
-            if results['phone_filter'] == "With Phone Only":
-                filter_suffix = " (📞)"
-            elif results['phone_filter'] == "Without Phone Only":
-                filter_suffix = " (📵)"
+        self.one_file_tree.clear()
+        self.one_file_tree.addTopLevelItems([
+            QTreeWidgetItem([str(index), contact.name, contact.phone or 'No Phone', file_names[file_index]])
+            for index, ((file_index, contact), *_) in enumerate(results['in_one_file'], 1)
+        ])
         
-        self.results_tab.setTabText(1, f"Only in File 1 ({len(results['only_in_file1'])}){filter_suffix}")
-        self.results_tab.setTabText(2, f"Only in File 2 ({len(results['only_in_file2'])}){filter_suffix}")
-        self.results_tab.setTabText(3, f"Common Contacts ({len(results['common'])}){filter_suffix}")
+        self.subset_combo.blockSignals(True)
+        self.subset_combo.clear()
+        self.subset_combo.addItem(f"All contacts ({len(results['groups'])})", None)
+        for files, size in subsets:
+            self.subset_combo.addItem(f"{' + '.join(file_names[file_index] for file_index in files)} ({size})", files)
+        self.subset_combo.blockSignals(False)
+        self.presence_tree.setHeaderLabels(['#', 'Name', 'Phone'] + file_names + ['Files'])
+        self.display_presence()
+        
+        self.results_tab.setTabText(1, f"In All Files ({len(results['in_all_files'])})")
+        self.results_tab.setTabText(2, f"In One File Only ({len(results['in_one_file'])})")
     
-    def export_contacts(self, contact_type, export_format):
+    def shown_groups(self):
+        """The groups in the set of files chosen in the Presence tab, or all of them"""
+        results = self.comparison_results
+        files = self.subset_combo.currentData()
+        if files is None:
+            return results['groups']
+        return [group for group, group_files in zip(results['groups'], results['file_sets']) if group_files == files]
+    
+    def display_presence(self):
+        self.presence_tree.clear()
+        if not self.comparison_results:
+            return
+        
+        file_count = len(self.compared_paths)
+        items = []
+        for index, group in enumerate(self.shown_groups(), 1):
+            contact = group[0][1]
+            files = {file_index for file_index, _ in group}
+            items.append(QTreeWidgetItem(
+                [str(index), contact.name, contact.phone or 'No Phone'] +
+                ['✓' if file_index in files else '' for file_index in range(file_count)] +
+                [str(len(files))]
+            ))
+        self.presence_tree.addTopLevelItems(items)
+        self.results_tab.setTabText(3, f"Presence ({len(items)})")
+    
+    def category_groups(self, category):
+        if category == 'all_files':
+            return self.comparison_results['in_all_files']
+        elif category == 'one_file':
+            return self.comparison_results['in_one_file']
+        return self.shown_groups()
+    
+    def export_contacts(self, category, export_format):
         if not self.comparison_results:
             return
         
         if export_format == 'excel':
-            self.export_to_excel(contact_type)
+            self.export_to_excel(category)
         else:
-            self.export_to_vcf(contact_type)
+            self.export_to_vcf(category)
     
-    def export_to_excel(self, contact_type):
+    def _default_filename(self, category, extension):
+        filter_suffix = ""
+        if self.comparison_results['phone_filter'] == "With Phone Only":
+            filter_suffix = "_with_phone"
+        elif self.comparison_results['phone_filter'] == "Without Phone Only":
+            filter_suffix = "_without_phone"
+        names = {'all_files': "in_all_files", 'one_file': "in_one_file_only", 'shown': "shown_contacts", 'complete': "vcf_multi_comparison_complete"}
+        return f"{names[category]}{filter_suffix}.{extension}"
+    
+    def export_to_excel(self, category):
         """Export contacts to Excel format"""
         if not EXCEL_AVAILABLE:
             QMessageBox.critical(self, "Excel Export Error", 
@@ -929,22 +3831,19 @@ VCF Format Support:
                                "Install it with: pip install openpyxl")
             return
         
-        if contact_type == 'all':
-            # Export complete comparison to Excel
+        results = self.comparison_results
+        if category == 'complete':
             file_path, _ = QFileDialog.getSaveFileName(
                 self, "Export Complete Comparison to Excel", 
-                "vcf_comparison_complete.xlsx", 
+                self._default_filename(category, 'xlsx'), 
                 "Excel Files (*.xlsx)"
             )
             if not file_path:
                 return
             
             try:
-                ExcelExporter.export_comparison_to_excel(
-                    self.comparison_results, 
-                    file_path, 
-                    self.match_method_combo.currentText(), 
-                    self.phone_filter_combo.currentText()
+                ExcelExporter.export_multi_comparison_to_excel(
+                    results, self.file_names(), file_path, results['match_method'], results['phone_filter']
                 )
                 QMessageBox.information(self, "Export Success", 
                                       f"Complete comparison exported to {file_path}")
@@ -952,117 +3851,242 @@ VCF Format Support:
                 QMessageBox.critical(self, "Export Error", f"Error exporting to Excel: {str(e)}")
             return
         
-        # Single category export
-        contacts_to_export = []
-        default_filename = ""
-        
-        # Add filter suffix to filename
-        filter_suffix = ""
-        if self.comparison_results['phone_filter'] == "With Phone Only":
-            filter_suffix = "_with_phone"
-        elif self.comparison_results['phone_filter'] == "Without Phone Only":
-            filter_suffix = "_without_phone"
-        
-        if contact_type == 'file1':
-            current_data = self.file1_tree.get_current_data()
-            contacts_to_export = current_data
-            default_filename = f"only_in_file1{filter_suffix}.xlsx"
-        elif contact_type == 'file2':
-            current_data = self.file2_tree.get_current_data()
-            contacts_to_export = current_data
-            default_filename = f"only_in_file2{filter_suffix}.xlsx"
-        elif contact_type == 'common':
-            current_data = self.common_tree.get_current_data()
-            contacts_to_export = [pair[0] for pair in current_data]
-            default_filename = f"common_contacts{filter_suffix}.xlsx"
-        
+        contacts_to_export = [group[0][1] for group in self.category_groups(category)]
         if not contacts_to_export:
             QMessageBox.information(self, "Export", "No contacts to export.")
             return
         
-        file_path, _ = QFileDialog.getSaveFileName(self, "Export Contacts to Excel", default_filename, "Excel Files (*.xlsx)")
+        file_path, _ = QFileDialog.getSaveFileName(self, "Export Contacts to Excel", self._default_filename(category, 'xlsx'), "Excel Files (*.xlsx)")
         if not file_path:
             return
         
         try:
             ExcelExporter.export_contacts_to_excel(contacts_to_export, file_path)
-            filter_msg = f" (filtered: {self.comparison_results['phone_filter']})" if self.comparison_results['phone_filter'] != "All Contacts" else ""
-            QMessageBox.information(self, "Export Success", f"Exported {len(contacts_to_export)} contacts to {file_path}{filter_msg}")
+            QMessageBox.information(self, "Export Success", f"Exported {len(contacts_to_export)} contacts to {file_path}")
         except Exception as e:
             QMessageBox.critical(self, "Export Error", f"Error exporting to Excel: {str(e)}")
     
-    def export_to_vcf(self, contact_type):
-        """Export contacts to VCF format"""
-        contacts_to_export = []
-        default_filename = ""
-        
-        # Add filter suffix to filename
-        filter_suffix = ""
-        if self.comparison_results['phone_filter'] == "With Phone Only":
-            filter_suffix = "_with_phone"
-        elif self.comparison_results['phone_filter'] == "Without Phone Only":
-            filter_suffix = "_without_phone"
-        
-        if contact_type == 'file1':
-            # Get current sorted data from the tree widget
-            current_data = self.file1_tree.get_current_data()
-            contacts_to_export = current_data
-            default_filename = f"only_in_file1{filter_suffix}.vcf"
-        elif contact_type == 'file2':
-            # Get current sorted data from the tree widget
-            current_data = self.file2_tree.get_current_data()
-            contacts_to_export = current_data
-            default_filename = f"only_in_file2{filter_suffix}.vcf"
-        elif contact_type == 'common':
-            # For common contacts, export from file1 (first contact in each pair)
-            current_data = self.common_tree.get_current_data()
-            contacts_to_export = [pair[0] for pair in current_data]
-            default_filename = f"common_contacts{filter_suffix}.vcf"
-        
-        if not contacts_to_export:
+    def export_to_vcf(self, category):
+        """Export contacts to VCF format, each card from the first file it was found in"""
+        groups = self.category_groups(category)
+        if not groups:
             QMessageBox.information(self, "Export", "No contacts to export.")
             return
         
-        file_path, _ = QFileDialog.getSaveFileName(self, "Export Contacts", default_filename, "VCF Files (*.vcf)")
+        file_path, _ = QFileDialog.getSaveFileName(self, "Export Contacts", self._default_filename(category, 'vcf'), "VCF Files (*.vcf)")
         if not file_path:
             return
         
+        card_indexes = {}
         try:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                for contact in contacts_to_export:
-                    in_photo = False
-                    for line in contact.original_lines:
-                        stripped_line = line.strip()
-                        
-                        if stripped_line == '':
-                            f.write('\n')
-                            continue
-                            
-                        if stripped_line.upper().startswith('PHOTO'):
-                            f.write(stripped_line + '\n')
-                            in_photo = True
-                        elif in_photo:
-                            if stripped_line.startswith('END:VCARD'):
-                                f.write(line + '\n')
-                                in_photo = False
-                            else:
-                                f.write(' ' + line.lstrip() + '\n')
-                        else:
-                            f.write(line + '\n')
+            for file_index in sorted({group[0][0] for group in groups}):
+                source_path = self.compared_paths[file_index]
+                if self._file_stat(source_path) != self.source_stats.get(source_path):
+                    raise ValueError(f"{source_path} changed since the comparison, please compare again")
+                card_indexes[file_index] = VcfCardIndex(source_path)
             
-            filter_msg = f" (filtered: {self.comparison_results['phone_filter']})" if self.comparison_results['phone_filter'] != "All Contacts" else ""
-            QMessageBox.information(self, "Export Success", f"Exported {len(contacts_to_export)} contacts to {file_path}{filter_msg}")
+            newline = os.linesep.encode()
+            with open(file_path, 'wb') as f:
+                for group in groups:
+                    file_index, contact = group[0]
+                    write_card(f, card_indexes[file_index].card_lines(contact.card_no), newline)
+            
+            QMessageBox.information(self, "Export Success", f"Exported {len(groups)} contacts to {file_path}")
         except Exception as e:
             QMessageBox.critical(self, "Export Error", f"Error exporting contacts: {str(e)}")
+        finally:
+            for card_index in card_indexes.values():
+                card_index.close()
+
+class DuplicatesWindow(QMainWindow):
+    """Groups of duplicate contacts in the viewer's address book, for bulk deletion.
+
+    Selection is the viewer's own: checking a contact here selects it in
+    the viewer's ContactStore as well.
+    """
+    def __init__(self, viewer):
+        super().__init__(viewer)
+        self.viewer = viewer
+        self.groups = []
+        self.initUI()
+    
+    def initUI(self):
+        self.setWindowTitle('Find Duplicates')
+        self.setGeometry(200, 200, 1000, 700)
+        
+        central_widget = QWidget()
+        self.setCentralWidget(central_widget)
+        layout = QVBoxLayout(central_widget)
+        
+        options_layout = QHBoxLayout()
+        options_layout.addWidget(QLabel("Match By:"))
+        self.match_combo = QComboBox()
+        self.match_combo.addItems(["Name or Phone", "Phone Only", "Name Only"])
+        self.match_combo.setToolTip("Contacts sharing any phone number or the same name are grouped, also through other contacts")
+        options_layout.addWidget(self.match_combo)
+        self.find_btn = QPushButton("Find Duplicates")
+        self.find_btn.clicked.connect(self.find_duplicates)
+        options_layout.addWidget(self.find_btn)
+        self.summary_label = QLabel("")
+        options_layout.addWidget(self.summary_label)
+        options_layout.addStretch()
+        
+        self.tree = QTreeWidget()
+        self.tree.setHeaderLabels(['Group', 'Name', 'Phone', 'Additional Phones', 'Photo', 'Select'])
+        self.tree.setColumnWidth(0, 110)
+        self.tree.setColumnWidth(1, 200)
+        self.tree.setColumnWidth(2, 150)
+        self.tree.setColumnWidth(3, 150)
+        self.tree.setColumnWidth(4, 60)
+        self.tree.itemChanged.connect(self.handle_item_changed)
+        
+        button_layout = QHBoxLayout()
+        self.select_duplicates_btn = QPushButton("Select Duplicates (Keep First)")
+        self.select_duplicates_btn.setToolTip("Select every contact of each group except its first one")
+        self.select_duplicates_btn.clicked.connect(self.select_duplicates)
+        self.deselect_btn = QPushButton("Deselect All")
+        self.deselect_btn.clicked.connect(self.deselect_all)
+        self.delete_btn = QPushButton("Delete Selected")
+        self.delete_btn.clicked.connect(self.delete_selected)
+        self.merge_btn = QPushButton("Save Merged VCF")
+        self.merge_btn.setToolTip("Save the address book with each group merged into one contact")
+        self.merge_btn.clicked.connect(self.save_merged)
+        button_layout.addWidget(self.select_duplicates_btn)
+        button_layout.addWidget(self.deselect_btn)
+        button_layout.addWidget(self.delete_btn)
+        button_layout.addWidget(self.merge_btn)
+        button_layout.addStretch()
+        
+        layout.addLayout(options_layout)
+        layout.addWidget(self.tree)
+        layout.addLayout(button_layout)
+    
+    def find_duplicates(self):
+        if not self.viewer.load_all():
+            return
+        store = self.viewer.store
+        match_by = self.match_combo.currentText()
+        self.groups = store.duplicate_groups(
+            store.rows(), by_name=match_by != "Phone Only", by_phone=match_by != "Name Only"
+        )
+        self.display_groups()
+    
+    def display_groups(self):
+        store = self.viewer.store
+        self.tree.itemChanged.disconnect(self.handle_item_changed)
+        self.tree.clear()
+        
+        for number, group in enumerate(self.groups, start=1):
+            group_item = QTreeWidgetItem([f"Group {number}", f"{len(group)} contacts"])
+            font = group_item.font(0)
+            font.setBold(True)
+            group_item.setFont(0, font)
+            for row in group:
+                item = QTreeWidgetItem([
+                    '',
+                    store.names[row],
+                    store.phones[row] or 'No Phone',
+                    store.additional_phones(row) or '-',
+                    '🖼️' if store.has_flag(row, ContactStore.HAS_PHOTO) else '',
+                ])
+                selected = store.has_flag(row, ContactStore.SELECTED)
+                item.setCheckState(5, Qt.CheckState.Checked if selected else Qt.CheckState.Unchecked)
+                item.setData(0, Qt.ItemDataRole.UserRole, row)
+                group_item.addChild(item)
+            self.tree.addTopLevelItem(group_item)
+            group_item.setExpanded(True)
+        
+        self.tree.itemChanged.connect(self.handle_item_changed)
+        duplicates = sum(len(group) - 1 for group in self.groups)
+        self.summary_label.setText(f"{len(self.groups)} groups, {duplicates} duplicates")
+    
+    def handle_item_changed(self, item, column):
+        row = item.data(0, Qt.ItemDataRole.UserRole)
+        if column == 5 and row is not None:
+            selected = item.checkState(5) == Qt.CheckState.Checked
+            self.viewer.store.set_flag([row], ContactStore.SELECTED, selected)
+            self.viewer.update_status_counts()
+    
+    def select_duplicates(self):
+        store = self.viewer.store
+        for group in self.groups:
+            store.set_flag(group[:1], ContactStore.SELECTED, False)
+            store.set_flag(group[1:], ContactStore.SELECTED)
+        self.display_groups()
+        self.viewer.display_contacts()
+    
+    def deselect_all(self):
+        self.viewer.store.set_flag([row for group in self.groups for row in group], ContactStore.SELECTED, False)
+        self.display_groups()
+        self.viewer.display_contacts()
+    
+    def delete_selected(self):
+        """Delete the selected contacts of the groups shown, then look for duplicates again"""
+        store = self.viewer.store
+        rows = [row for group in self.groups for row in group if store.has_flag(row, ContactStore.SELECTED)]
+        if not rows:
+            QMessageBox.information(self, "No Selection", "No duplicate contacts selected")
+            return
+        
+        store.set_flag(rows, ContactStore.DELETED)
+        self.viewer.rows = [row for row in self.viewer.rows if not store.has_flag(row, ContactStore.DELETED)]
+        self.viewer.display_contacts()
+        self.viewer.status_bar.showMessage(f"Deleted {len(rows)} duplicate contacts")
+        self.find_duplicates()
+    
+    def save_merged(self):
+        """Write every contact to a new VCF, with each group merged into one card"""
+        if not self.groups:
+            QMessageBox.information(self, "No Duplicates", "No duplicate contacts to merge")
+            return
+        
+        file_path, _ = QFileDialog.getSaveFileName(self, "Save Merged VCF", "merged_contacts.vcf", "VCF Files (*.vcf)")
+        if not file_path:
+            return
+        
+        store = self.viewer.store
+        card_index = self.viewer.card_index
+        try:
+            merger = VcfMerger(*store.phone_key_options)
+            written = self.viewer.write_over(
+                file_path, lambda path: merger.write_merged(path, store, store.rows(), self.groups, card_index))
+            QMessageBox.information(self, "Merge Success", f"Saved {written} contacts, {len(self.groups)} of them merged, to {file_path}")
+        except Exception as e:
+            QMessageBox.critical(self, "Merge Error", f"Error saving merged contacts: {str(e)}")
+        if self.viewer.store is not store:
+            # Saved over the open file, which was imported again
+            self.find_duplicates()
+    
+    def closeEvent(self, event):
+        # Single checks only update the viewer's counts; redraw its list once here
+        self.viewer.display_contacts()
+        super().closeEvent(event)
 
 class ContactViewer(QMainWindow):
+    # Cards are read from the open file again to save them or show a photo
+    VIEW_FIELDS = ('name', 'tel', 'photo')
+    # Rows added to the list at a time, as it is scrolled to its end
+    PAGE_ROWS = 500
+
     def __init__(self):
         super().__init__()
-        self.all_contacts = []
-        self.contacts = []
+        # Every contact read so far, and the rows of it that are shown, in view order
+        self.store = ContactStore()
+        self.rows = []
+        # Offsets of the open file's cards. Cards are parsed a page at a
+        # time as the list is scrolled, or all at once by load_all.
+        self.card_index = None
+        self.source_stat = None
+        self.parsed_cards = 0
+        # How many of self.rows have items in the list
+        self.shown_rows = 0
+        self.parser = VcfParser(fields=self.VIEW_FIELDS)
+        self.parse_cache = VcfParseCache()
         self.sort_column = 1
         self.sort_order = Qt.SortOrder.AscendingOrder
         self.comparison_window = None
+        self.multi_comparison_window = None
+        self.duplicates_window = None
         self.initUI()
 
     def initUI(self):
@@ -1077,6 +4101,7 @@ class ContactViewer(QMainWindow):
         self.tree.itemChanged.connect(self.handle_item_changed)
         self.tree.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
         self.tree.customContextMenuRequested.connect(self.show_context_menu)
+        self.tree.verticalScrollBar().valueChanged.connect(self.scrolled)
 
         header = self.tree.header()
         header.setSectionsClickable(True)
@@ -1164,6 +4189,18 @@ class ContactViewer(QMainWindow):
         compare_action.triggered.connect(self.open_comparison_window)
         tools_menu.addAction(compare_action)
 
+        multi_compare_action = QAction('Compare Multiple VCF Files', self)
+        multi_compare_action.triggered.connect(self.open_multi_comparison_window)
+        tools_menu.addAction(multi_compare_action)
+
+        duplicates_action = QAction('Find Duplicates', self)
+        duplicates_action.triggered.connect(self.open_duplicates_window)
+        tools_menu.addAction(duplicates_action)
+
+        clear_cache_action = QAction('Clear Parse Cache', self)
+        clear_cache_action.triggered.connect(self.clear_parse_cache)
+        tools_menu.addAction(clear_cache_action)
+
         self.status_bar = QStatusBar()
         self.setStatusBar(self.status_bar)
         
@@ -1181,7 +4218,9 @@ class ContactViewer(QMainWindow):
 
     def export_to_excel(self):
         """Export current contacts to Excel"""
-        if not self.contacts:
+        if not self.load_all():
+            return
+        if not self.rows:
             self.show_warning("Empty List", "No contacts to export")
             return
 
@@ -1190,12 +4229,19 @@ class ContactViewer(QMainWindow):
             return
 
         try:
-            ExcelExporter.export_contacts_to_excel(self.contacts, file_path)
-            self.status_bar.showMessage(f"Exported {len(self.contacts)} contacts to Excel")
-            QMessageBox.information(self, "Export Success", f"Exported {len(self.contacts)} contacts to {file_path}")
+            ExcelExporter.export_contacts_to_excel(self.store.contacts(self.rows), file_path)
+            self.status_bar.showMessage(f"Exported {len(self.rows)} contacts to Excel")
+            QMessageBox.information(self, "Export Success", f"Exported {len(self.rows)} contacts to {file_path}")
         except Exception as e:
             self.show_error("Excel Export Error", str(e))
 
+    def clear_parse_cache(self):
+        try:
+            self.parse_cache.clear()
+            self.status_bar.showMessage("Parse cache cleared")
+        except Exception as e:
+            self.show_error("Cache Error", str(e))
+
     def open_comparison_window(self):
         if self.comparison_window is None:
             self.comparison_window = ComparisonWindow(self)
@@ -1203,6 +4249,23 @@ class ContactViewer(QMainWindow):
         self.comparison_window.raise_()
         self.comparison_window.activateWindow()
 
+    def open_multi_comparison_window(self):
+        if self.multi_comparison_window is None:
+            self.multi_comparison_window = MultiComparisonWindow(self)
+        self.multi_comparison_window.show()
+        self.multi_comparison_window.raise_()
+        self.multi_comparison_window.activateWindow()
+
+    def open_duplicates_window(self):
+        if not self.load_all():
+            return
+        if self.duplicates_window is None:
+            self.duplicates_window = DuplicatesWindow(self)
+        self.duplicates_window.find_duplicates()
+        self.duplicates_window.show()
+        self.duplicates_window.raise_()
+        self.duplicates_window.activateWindow()
+
     def handle_header_click(self, logical_index):
         self.sort_contacts(logical_index)
 
@@ -1212,33 +4275,121 @@ class ContactViewer(QMainWindow):
             return
 
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            parser = VcfParser()
-            self.all_contacts = parser.parse_vcf(content)
-            self.contacts = self.all_contacts.copy()
-            self.display_contacts()
+            self.open_file(file_path)
             self.status_bar.showMessage("File loaded successfully")
         except Exception as e:
             self.show_error("Import Error", str(e))
 
+    def open_file(self, file_path):
+        """Index the cards of a file and show its first page of contacts.
+
+        A file in the parse cache is complete at once; otherwise only the
+        cards shown are parsed.
+        """
+        card_index = VcfCardIndex(file_path)
+        if self.card_index is not None:
+            self.card_index.close()
+        self.card_index = card_index
+        stat = os.stat(file_path)
+        self.source_stat = (stat.st_size, stat.st_mtime_ns)
+        store = self.parse_cache.load(file_path, self.parser.fields)
+        self.store = store if store is not None else ContactStore()
+        self.parsed_cards = len(card_index) if store is not None else 0
+        self.rows = self.store.rows()
+        self.load_cards(self.PAGE_ROWS)
+        self.display_contacts()
+
+    def check_source(self):
+        """Raise if the open file changed, since its card offsets no longer hold"""
+        stat = os.stat(self.card_index.file_path)
+        if (stat.st_size, stat.st_mtime_ns) != self.source_stat:
+            raise ValueError(f"{self.card_index.file_path} changed since it was opened, please import it again")
+
+    def load_cards(self, row_count):
+        """Parse further cards until row_count rows can be shown or every card is read"""
+        card_count = len(self.card_index) if self.card_index is not None else 0
+        while len(self.rows) < row_count and self.parsed_cards < card_count:
+            self.check_source()
+            first = self.parsed_cards
+            last = min(first + self.PAGE_ROWS, card_count)
+            start = len(self.store)
+            for contact in self.card_index.contacts(first, last, self.parser):
+                self.store.append(contact)
+            self.parsed_cards = last
+            self.rows.extend(range(start, len(self.store)))
+
+    def load_all(self):
+        """Read every card, for operations on the whole address book.
+
+        Returns False, after showing why, if the file cannot be read.
+        """
+        if self.card_index is None or self.parsed_cards == len(self.card_index):
+            return True
+        try:
+            self.check_source()
+            self.status_bar.showMessage("Reading all contacts...")
+            self.status_bar.repaint()
+            store = self.parse_cache.parse(self.card_index.file_path, self.parser)
+        except Exception as e:
+            self.show_error("Import Error", str(e))
+            return False
+        # Rows read so far keep their selection and deletion
+        store.flags[:len(self.store)] = self.store.flags
+        self.store = store
+        self.parsed_cards = len(self.card_index)
+        self.rows = store.rows()
+        self.status_bar.showMessage(self.parse_cache.last_error or "All contacts read")
+        return True
+
+    def scrolled(self, value):
+        """Show the next page of rows once the list is scrolled to its end"""
+        if value < self.tree.verticalScrollBar().maximum() or self.card_index is None:
+            return
+        try:
+            self.load_cards(self.shown_rows + self.PAGE_ROWS)
+        except Exception as e:
+            self.show_error("Import Error", str(e))
+            return
+        if self.shown_rows < len(self.rows):
+            self.tree.itemChanged.disconnect(self.handle_item_changed)
+            self.add_items()
+            self.tree.itemChanged.connect(self.handle_item_changed)
+            self.update_status_counts()
+
     def display_contacts(self):
         self.tree.itemChanged.disconnect(self.handle_item_changed)
         self.tree.clear()
+        self.shown_rows = 0
+        self.add_items()
         
-        for index, contact in enumerate(self.contacts, start=1):
+        # Update header sort indicator
+        if self.sort_column != 0:
+            self.tree.header().setSortIndicator(self.sort_column, self.sort_order)
+        else:
+            self.tree.header().setSortIndicator(-1, self.sort_order)  # Clear sort indicator
+        
+        self.tree.itemChanged.connect(self.handle_item_changed)
+        self.update_status_counts()
+
+    def add_items(self):
+        """Add list items for the next page of rows"""
+        store = self.store
+        end = min(self.shown_rows + self.PAGE_ROWS, len(self.rows))
+        for index in range(self.shown_rows, end):
+            row = self.rows[index]
+            selected = store.has_flag(row, ContactStore.SELECTED)
             item = QTreeWidgetItem([
-                str(index),
-                contact.name,
-                contact.phone or 'No Phone',
-                contact.additional_phones or '-',
-                '🖼️' if contact.has_photo else '',
+                str(index + 1),
+                store.names[row],
+                store.phones[row] or 'No Phone',
+                store.additional_phones(row) or '-',
+                '🖼️' if store.has_flag(row, ContactStore.HAS_PHOTO) else '',
             ])
-            item.setCheckState(5, Qt.CheckState.Checked if contact.selected else Qt.CheckState.Unchecked)
-            item.setData(0, Qt.ItemDataRole.UserRole, contact)
+            item.setCheckState(5, Qt.CheckState.Checked if selected else Qt.CheckState.Unchecked)
+            item.setData(0, Qt.ItemDataRole.UserRole, row)
             
             # Set background color for selected contacts
-            if contact.selected:
+            if selected:
                 selected_color = QColor(173, 216, 230)  # Light blue background
                 for col in range(6):  # Apply to all columns
                     item.setBackground(col, QBrush(selected_color))
@@ -1248,23 +4399,15 @@ class ContactViewer(QMainWindow):
                     item.setBackground(col, QBrush())
             
             self.tree.addTopLevelItem(item)
-        
-        # Update header sort indicator
-        if self.sort_column != 0:
-            self.tree.header().setSortIndicator(self.sort_column, self.sort_order)
-        else:
-            self.tree.header().setSortIndicator(-1, self.sort_order)  # Clear sort indicator
-        
-        self.tree.itemChanged.connect(self.handle_item_changed)
-        self.update_status_counts()
+        self.shown_rows = end
 
     def handle_item_changed(self, item, column):
         if column == 5:
-            contact = item.data(0, Qt.ItemDataRole.UserRole)
-            contact.selected = item.checkState(5) == Qt.CheckState.Checked
+            selected = item.checkState(5) == Qt.CheckState.Checked
+            self.store.set_flag([item.data(0, Qt.ItemDataRole.UserRole)], ContactStore.SELECTED, selected)
             
             # Update row background color based on selection
-            if contact.selected:
+            if selected:
                 selected_color = QColor(173, 216, 230)  # Light blue background
                 for col in range(6):  # Apply to all columns
                     item.setBackground(col, QBrush(selected_color))
@@ -1286,56 +4429,59 @@ class ContactViewer(QMainWindow):
             self.sort_column = column
             self.sort_order = Qt.SortOrder.AscendingOrder
 
+        if column != 0 and not self.load_all():
+            return
+        store = self.store
+        reverse = self.sort_order == Qt.SortOrder.DescendingOrder
         if column == 0:  # Row number column - reset to original order
-            self.contacts = self.all_contacts.copy()
+            self.rows = store.rows()
             # Apply current search filter if active
-            search_term = self.search_box.text().lower().replace('ي', 'ی').replace('ك', 'ک')
+            search_term = normalize_name(self.search_box.text())
             if search_term:
-                self.contacts = [
-                    c for c in self.contacts
-                    if (search_term in c.name.lower() or 
-                        (c.phone and search_term in c.phone) or 
-                        (c.additional_phones and search_term in c.additional_phones))
-                ]
+                self.rows = store.search(self.rows, search_term)
         elif column == 1:
-            self.contacts.sort(key=lambda x: x.name.lower(), reverse=self.sort_order == Qt.SortOrder.DescendingOrder)
+            self.rows.sort(key=store.name_keys.__getitem__, reverse=reverse)
         elif column == 2:
-            self.contacts.sort(key=lambda x: x.phone or '', reverse=self.sort_order == Qt.SortOrder.DescendingOrder)
+            phones = store.phones
+            self.rows.sort(key=lambda row: phones[row] or '', reverse=reverse)
         elif column == 3:
-            self.contacts.sort(key=lambda x: len(x.additional_phones.split(', ')) if x.additional_phones else 0, reverse=self.sort_order == Qt.SortOrder.DescendingOrder)
+            self.rows.sort(key=store.additional_phone_count, reverse=reverse)
         elif column == 4:
-            self.contacts.sort(key=lambda x: not x.has_photo, reverse=self.sort_order == Qt.SortOrder.DescendingOrder)
+            self.rows.sort(key=lambda row: not store.flags[row] & ContactStore.HAS_PHOTO, reverse=reverse)
         elif column == 5:
-            self.contacts.sort(key=lambda x: not x.selected, reverse=self.sort_order == Qt.SortOrder.DescendingOrder)
+            self.rows.sort(key=lambda row: not store.flags[row] & ContactStore.SELECTED, reverse=reverse)
             
         self.display_contacts()
 
     def filter_contacts(self):
-        search_term = self.search_box.text().lower().replace('ي', 'ی').replace('ك', 'ک')
-        if not search_term:
-            self.contacts = self.all_contacts.copy()
-        else:
-            self.contacts = [
-                c for c in self.all_contacts
-                if (search_term in c.name.lower() or 
-                    (c.phone and search_term in c.phone) or 
-                    (c.additional_phones and search_term in c.additional_phones))
-            ]
+        search_term = normalize_name(self.search_box.text())
+        if search_term and not self.load_all():
+            return
+        self.rows = self.store.rows()
+        if search_term:
+            self.rows = self.store.search(self.rows, search_term)
         self.display_contacts()
 
     def clear_search(self):
         self.search_box.clear()
-        self.contacts = self.all_contacts.copy()
+        self.rows = self.store.rows()
         self.display_contacts()
 
     def show_photo(self, item):
-        contact = item.data(0, Qt.ItemDataRole.UserRole)
-        if contact.photo_data:
+        row = item.data(0, Qt.ItemDataRole.UserRole)
+        data = None
+        if self.store.has_flag(row, ContactStore.HAS_PHOTO):
+            try:
+                self.check_source()
+                data = self.card_index.photo_data(self.store.card_nos[row])
+            except Exception as e:
+                self.show_error("Image Error", str(e))
+                return
+        if data:
             try:
-                data = contact.photo_data
                 missing_padding = len(data) % 4
                 if missing_padding:
-                    data += '=' * (4 - missing_padding)
+                    data += b'=' * (4 - missing_padding)
                 
                 image_data = b64decode(data)
                 
@@ -1359,30 +4505,34 @@ class ContactViewer(QMainWindow):
             self.status_bar.showMessage("No photo available")
 
     def delete_selected(self):
-        selected_contacts = [c for c in self.all_contacts if c.selected]
-        if not selected_contacts:
+        selected_rows = self.store.rows(ContactStore.SELECTED)
+        if not selected_rows:
             self.show_warning("No Selection", "No contacts selected")
             return
             
-        self.all_contacts = [c for c in self.all_contacts if not c.selected]
-        self.contacts = self.all_contacts.copy()
+        self.store.set_flag(selected_rows, ContactStore.DELETED)
+        self.rows = self.store.rows()
         self.display_contacts()
-        self.status_bar.showMessage(f"Deleted {len(selected_contacts)} contacts")
+        self.status_bar.showMessage(f"Deleted {len(selected_rows)} contacts")
 
     def delete_contacts_without_phone(self):
-        initial_count = len(self.contacts)
-        self.contacts = [c for c in self.contacts if c.phone and c.phone.strip()]
-        removed_count = initial_count - len(self.contacts)
+        if not self.load_all():
+            return
+        initial_count = len(self.rows)
+        self.rows = self.store.rows_with_phone(self.rows)
+        removed_count = initial_count - len(self.rows)
         
         if removed_count > 0:
-            self.all_contacts = [c for c in self.all_contacts if c.phone and c.phone.strip()]
+            self.store.set_flag(self.store.rows_with_phone(self.store.rows(), False), ContactStore.DELETED)
             self.display_contacts()
             self.status_bar.showMessage(f"Removed {removed_count} contacts without phone numbers")
         else:
             self.status_bar.showMessage("No contacts without phone numbers found")
 
     def save_vcf(self):
-        if not self.contacts:
+        if not self.load_all():
+            return
+        if not self.rows:
             self.show_warning("Empty List", "No contacts to save")
             return
 
@@ -1390,32 +4540,47 @@ class ContactViewer(QMainWindow):
         if not file_path:
             return
 
+        card_index = self.card_index
+        card_nos = self.store.card_nos
+        rows = self.rows
+
+        def write(path):
+            newline = os.linesep.encode()
+            with open(path, 'wb') as f:
+                for row in rows:
+                    write_card(f, card_index.card_lines(card_nos[row]), newline)
+
         try:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                for contact in self.contacts:
-                    in_photo = False
-                    for line in contact.original_lines:
-                        stripped_line = line.strip()
-                        
-                        if stripped_line == '':
-                            f.write('\n')
-                            continue
-                            
-                        if stripped_line.upper().startswith('PHOTO'):
-                            f.write(stripped_line + '\n')
-                            in_photo = True
-                        elif in_photo:
-                            if stripped_line.startswith('END:VCARD'):
-                                f.write(line + '\n')
-                                in_photo = False
-                            else:
-                                f.write(' ' + line.lstrip() + '\n')
-                        else:
-                            f.write(line + '\n')
+            self.write_over(file_path, write)
             self.status_bar.showMessage("VCF saved successfully")
         except Exception as e:
             self.show_error("Saving Error", str(e))
 
+    def write_over(self, file_path, write):
+        """Call write(path) on a temporary file, then move it to file_path.
+
+        Cards are read from the open file while writing, so it must not be
+        truncated first. Saving over it imports the saved file afterwards.
+        """
+        self.check_source()
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(file_path)), suffix='.tmp')
+        os.close(fd)
+        try:
+            result = write(tmp_path)
+            if os.path.exists(file_path) and os.path.samefile(file_path, self.card_index.file_path):
+                # A mapped file cannot be replaced everywhere
+                self.card_index.close()
+                try:
+                    os.replace(tmp_path, file_path)
+                finally:
+                    self.open_file(file_path)
+            else:
+                os.replace(tmp_path, file_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return result
+
     def show_error(self, title, message):
         msg = QMessageBox()
         msg.setIcon(QMessageBox.Icon.Critical)
@@ -1474,28 +4639,33 @@ class ContactViewer(QMainWindow):
         self.status_bar.showMessage(f"Copied to clipboard: {text[:50]}{'...' if len(text) > 50 else ''}")
 
     def select_all(self):
-        for contact in self.contacts:
-            contact.selected = True
+        if not self.load_all():
+            return
+        self.store.set_flag(self.rows, ContactStore.SELECTED)
         self.display_contacts()
         self.status_bar.showMessage("All contacts selected")
 
     def deselect_all(self):
-        for contact in self.contacts:
-            contact.selected = False
+        self.store.set_flag(self.rows, ContactStore.SELECTED, False)
         self.display_contacts()
         self.status_bar.showMessage("All contacts deselected")
 
     def invert_selection(self):
-        for contact in self.contacts:
-            contact.selected = not contact.selected
+        if not self.load_all():
+            return
+        self.store.toggle_flag(self.rows, ContactStore.SELECTED)
         self.display_contacts()
         self.status_bar.showMessage("Selection inverted")
 
     def update_status_counts(self):
-        total_contacts = len(self.contacts)
-        selected_contacts = len([c for c in self.contacts if c.selected])
+        total_contacts = len(self.rows)
+        selected_contacts = self.store.count_flag(self.rows, ContactStore.SELECTED)
         
-        self.contact_count_label.setText(f"Contacts: {total_contacts}")
+        if self.card_index is not None and self.parsed_cards < len(self.card_index):
+            self.contact_count_label.setText(
+                f"Contacts: {total_contacts} ({self.parsed_cards} of {len(self.card_index)} cards read)")
+        else:
+            self.contact_count_label.setText(f"Contacts: {total_contacts}")
         self.selected_count_label.setText(f"Selected: {selected_contacts}")
 
 if __name__ == '__main__':